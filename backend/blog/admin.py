@@ -1,7 +1,10 @@
 # Register your models here.
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Comment, Post
+from . import stats
+from .classification import forget_flagged, record_flagged
+from .models import ArchivedComment, Comment, Post
 
 
 @admin.register(Post)
@@ -13,12 +16,12 @@ class PostAdmin(admin.ModelAdmin):
     date_hierarchy = "created_at"
 
     def comment_count(self, obj):
-        return obj.comments.count()
+        return obj.comments.count() + obj.archived_comment_count
 
     comment_count.short_description = "Comments"
 
     def flagged_count(self, obj):
-        return obj.comments.filter(flagged=True).count()
+        return obj.comments.filter(flagged=True).count() + obj.archived_flagged_count
 
     flagged_count.short_description = "Flagged"
 
@@ -31,6 +34,8 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ["flagged", "created_at"]
     search_fields = ["author", "text", "post__title"]
     date_hierarchy = "created_at"
+    # Set by save_model and the actions when a moderator changes the flag
+    readonly_fields = ["overridden"]
     actions = ["mark_as_flagged", "mark_as_safe"]
 
     def text_preview(self, obj):
@@ -38,14 +43,72 @@ class CommentAdmin(admin.ModelAdmin):
 
     text_preview.short_description = "Text"
 
+    def save_model(self, request, obj, form, change):
+        """Record flag changes made in the edit form as moderator overrides"""
+        with transaction.atomic():
+            old = Comment.objects.get(pk=obj.pk) if change else None
+            if old is not None:
+                stats.comments_removed([old])
+                if "flagged" in form.changed_data:
+                    obj.overridden = not obj.overridden
+            super().save_model(request, obj, form, change)
+            stats.comments_added([obj])
+
+        # Keep the near-duplicate index in line with the edited comment
+        was_flagged = old is not None and old.flagged
+        text_changed = old is not None and old.text != obj.text
+        if was_flagged and (not obj.flagged or text_changed):
+            forget_flagged(old.text)
+        if obj.flagged and (not was_flagged or text_changed):
+            record_flagged(obj.text, share=True)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            stats.comments_removed([obj])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            stats.comments_removed(queryset)
+            super().delete_queryset(request, queryset)
+
     def mark_as_flagged(self, request, queryset):
-        updated = queryset.update(flagged=True)
+        for text in queryset.values_list("text", flat=True):
+            record_flagged(text, share=True)
+        updated = stats.set_flagged(queryset, True)
         self.message_user(request, f"{updated} comment(s) marked as flagged.")
 
     mark_as_flagged.short_description = "Mark selected as flagged"
 
     def mark_as_safe(self, request, queryset):
-        updated = queryset.update(flagged=False)
+        for text in queryset.values_list("text", flat=True):
+            forget_flagged(text)
+        updated = stats.set_flagged(queryset, False)
         self.message_user(request, f"{updated} comment(s) marked as safe.")
 
     mark_as_safe.short_description = "Mark selected as safe"
+
+
+@admin.register(ArchivedComment)
+class ArchivedCommentAdmin(admin.ModelAdmin):
+    """Read-only admin interface for archived comments"""
+
+    list_display = ["author", "post", "text_preview", "flagged", "created_at"]
+    list_filter = ["flagged", "created_at"]
+    search_fields = ["author", "text", "post__title"]
+    date_hierarchy = "created_at"
+
+    def text_preview(self, obj):
+        return obj.text[:50] + "..." if len(obj.text) > 50 else obj.text
+
+    text_preview.short_description = "Text"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Post counters and the daily rollups still include these comments.
+        return False
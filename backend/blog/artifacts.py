@@ -0,0 +1,200 @@
+"""
+Memory-mapped model artifacts.
+
+A model artifact is a single file holding a JSON header and any number of
+flat typed arrays, laid out so it can be opened without parsing or copying
+the arrays:
+
+    magic (8 bytes) | format version (u32) | header length (u32)
+    JSON header, padded to a 64-byte boundary
+    array data, each array starting on a 64-byte boundary
+
+The header records the model's metadata and, per array, its ``array``
+typecode, item size, byte order, offset (from the start of the data) and
+length. Opening an artifact maps the file read-only and hands out
+memoryviews straight into the mapping, so loading takes the same few
+milliseconds whatever the model's size, and every process that maps the
+file shares the same physical pages through the page cache. The arrays are
+aligned for SIMD loads and can be wrapped by ``numpy.frombuffer`` as-is.
+
+Artifacts are published with ``write_artifact``, which writes a temporary
+file next to the destination and renames it into place. The rename is
+atomic: readers see either the old file or the new one, and a reader that
+still has the old file mapped keeps a consistent view of it until it lets
+go. ``ArtifactWatcher`` notices the new file and remaps it, which is how
+running workers pick up a new model version without a restart.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SCMODEL\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# magic, format version, header length
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_artifact(path, arrays, metadata=None):
+    """
+    Atomically write ``arrays`` (a dict of name -> ``array.array``) and
+    JSON-serialisable ``metadata`` to an artifact at ``path``.
+    """
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {
+            "typecode": values.typecode,
+            "itemsize": values.itemsize,
+            "byteorder": sys.byteorder,
+            "offset": offset,
+            "length": len(values),
+        }
+        offset += len(values) * values.itemsize
+    header = json.dumps({"metadata": metadata or {}, "arrays": layout}).encode()
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".artifact-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for name, values in arrays.items():
+                f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+                values.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ModelArtifact:
+    """
+    A model artifact mapped read-only into memory.
+
+    ``metadata`` is the header's metadata dict and ``artifact[name]`` is a
+    read-only memoryview of the named array, backed by the mapping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        if len(buffer) < _PREAMBLE.size:
+            raise ValueError(f"{path} is not a model artifact")
+        magic, version, header_length = _PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model artifact")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} uses artifact format {version}, expected {FORMAT_VERSION}"
+            )
+        header_end = _PREAMBLE.size + header_length
+        header = json.loads(bytes(buffer[_PREAMBLE.size : header_end]))
+        data_start = _aligned(header_end)
+
+        self.metadata = header["metadata"]
+        self._arrays = {}
+        for name, spec in header["arrays"].items():
+            if (
+                spec["byteorder"] != sys.byteorder
+                or array(spec["typecode"]).itemsize != spec["itemsize"]
+            ):
+                raise ValueError(
+                    f"Array {name!r} in {path} was written on an incompatible platform"
+                )
+            start = data_start + spec["offset"]
+            end = start + spec["length"] * spec["itemsize"]
+            if end > len(buffer):
+                raise ValueError(f"{path} is truncated")
+            self._arrays[name] = buffer[start:end].cast(spec["typecode"])
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    @property
+    def version(self):
+        return self.metadata.get("version")
+
+
+class ArtifactWatcher:
+    """
+    Keeps the newest artifact at ``path`` mapped.
+
+    ``current()`` checks the file at most every ``check_seconds`` and
+    remaps it once a new file has been renamed into place. Callers that
+    still hold the previous artifact keep using it safely; its mapping is
+    released when the last of them drops it. If the new file cannot be
+    opened the previous artifact stays in use.
+    """
+
+    def __init__(self, path, check_seconds=10):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._artifact = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The mapped artifact, or None if none could be opened yet."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_seconds:
+            with self._lock:
+                if (
+                    self._checked_at is None
+                    or now - self._checked_at >= self.check_seconds
+                ):
+                    self._checked_at = now
+                    self._reload_if_changed()
+        return self._artifact
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._artifact is None:
+                logger.warning("Model artifact %s not found", self.path)
+            return
+        loaded = self._artifact
+        if loaded is not None and (stat.st_dev, stat.st_ino, stat.st_mtime_ns) == (
+            loaded.stat.st_dev,
+            loaded.stat.st_ino,
+            loaded.stat.st_mtime_ns,
+        ):
+            return
+        try:
+            self._artifact = ModelArtifact(self.path)
+        except (OSError, ValueError):
+            logger.exception("Could not load model artifact %s", self.path)
+            return
+        logger.info(
+            "Loaded model artifact %s (version %s)",
+            self.path,
+            self._artifact.version,
+        )
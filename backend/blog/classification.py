@@ -5,7 +5,25 @@ This module provides a modular classification system that can easily
 be extended with ML models (Hugging Face, OpenAI, etc.)
 """
 
-import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from smart_comments.metrics import observe_classification, observe_verdict
+
+from .artifacts import ArtifactWatcher
+from .limits import MAX_COMMENT_LENGTH
+from .patterns import compile_safe
+from .profiling import RuleProfiler
+from .similarity import (
+    NearDuplicateIndex,
+    SignatureLog,
+    minhash,
+    recent_flagged_comments,
+)
+from .spam_model import HashedLinearModel
 
 
 class ClassificationService:
@@ -14,8 +32,20 @@ class ClassificationService:
 
     Currently implements rule-based classification, but designed
     to be easily replaced with ML models.
+
+    When given a NearDuplicateIndex of known spam, comments that are
+    near-copies of previously flagged ones are flagged as well. When given
+    a RuleProfiler, the time and hits of each rule are recorded on a
+    sample of calls.
     """
 
+    def __init__(self, near_duplicates=None, profiler=None):
+        self.near_duplicates = near_duplicates
+        self.profiler = profiler
+        self.compiled_patterns = [
+            (pattern, compile_safe(pattern)) for pattern in self.SPAM_PATTERNS
+        ]
+
     # Keywords that indicate potentially harmful content
     OFFENSIVE_KEYWORDS = [
         "spam",
@@ -30,14 +60,28 @@ class ClassificationService:
         "jerk",
     ]
 
-    # Patterns that suggest spam
+    # Patterns that suggest spam. Checked for catastrophic backtracking when
+    # the service is created (see patterns.py).
     SPAM_PATTERNS = [
         r"https?://bit\.ly",  # Shortened URLs
-        r"https?://.*\.xyz",  # Suspicious TLDs
+        # Suspicious TLDs: a URL, then ".xyz" later on the same line. Only
+        # the line's first URL is tried (atomically), as any ".xyz" after a
+        # later one also follows the first, so matching stays linear.
+        r"(?m)^(?>[^\n]*?https?://)[^\n]*\.xyz",
         r"\b[A-Z]{5,}\b",  # Excessive caps
+        # The doubled backslash means this never matches a repeated
+        # character; kept as it is so it doesn't change verdicts.
         r"(.)\\1{4,}",  # Repeated characters (e.g., 'aaaaa')
     ]
 
+    # Spam patterns only scan this many leading characters of a comment;
+    # anything longer is already flagged as unusually long.
+    PATTERN_MAX_INPUT = 10_000
+
+    # Seconds all spam patterns may take together on one comment. Remaining
+    # patterns are skipped once it is spent and the comment goes to review.
+    PATTERN_TIME_BUDGET = 0.05
+
     def classify_comment(self, text: str) -> dict:
         """
         Classify a comment as safe or needs_review.
@@ -51,32 +95,49 @@ class ClassificationService:
                 - confidence: float between 0 and 1
                 - reasons: list of reasons for the classification
         """
+        profiler = self.profiler
+        if profiler is not None and not profiler.should_sample():
+            profiler = None
+        run = self._run
         text_lower = text.lower()
         reasons = []
 
         # Check for offensive keywords
         offensive_found = [
-            word for word in self.OFFENSIVE_KEYWORDS if word in text_lower
+            word
+            for word in self.OFFENSIVE_KEYWORDS
+            if run(profiler, f"keyword: {word}", text_lower.__contains__, word)
         ]
         if offensive_found:
             reasons.append(f"Contains keywords: {', '.join(offensive_found)}")
 
         # Check for spam patterns
-        for pattern in self.SPAM_PATTERNS:
-            if re.search(pattern, text):
+        scanned = text[: self.PATTERN_MAX_INPUT]
+        deadline = time.perf_counter() + self.PATTERN_TIME_BUDGET
+        for pattern, regex in self.compiled_patterns:
+            if time.perf_counter() > deadline:
+                reasons.append("Spam pattern checks timed out")
+                break
+            if run(profiler, f"pattern: {pattern}", regex.search, scanned):
                 reasons.append(f"Matches spam pattern: {pattern}")
 
         # Check length (very short or very long might be suspicious)
-        if len(text.strip()) < 3:
-            reasons.append("Comment too short")
-        elif len(text) > 1000:
-            reasons.append("Comment unusually long")
+        length_reason = run(profiler, "length", self._check_length, text)
+        if length_reason:
+            reasons.append(length_reason)
 
         # Check for excessive punctuation
-        punct_ratio = sum(1 for c in text if c in "!?.,;:") / max(len(text), 1)
-        if punct_ratio > 0.2:
+        if run(profiler, "punctuation", self._excessive_punctuation, text):
             reasons.append("Excessive punctuation")
 
+        # Check for near-copies of known spam
+        if self.near_duplicates is not None:
+            score = run(profiler, "near_duplicate", self._near_duplicate_score, text)
+            if score is not None:
+                reasons.append(
+                    f"Near-duplicate of flagged comment ({score:.0%} similar)"
+                )
+
         # Determine classification
         needs_review = len(reasons) > 0
 
@@ -87,16 +148,118 @@ class ClassificationService:
             "flagged": needs_review,
         }
 
+    def is_flagged(self, text: str) -> bool:
+        """
+        Fast verdict: whether a comment needs review, without the reasons.
+
+        Gives the same answer as classify_comment(text)["flagged"] but runs
+        the checks from cheapest to most expensive and stops at the first
+        one that fires. Comments over the length limit are decided before
+        anything copies or scans them. Use classify_comment when the
+        reasons are needed, e.g. to explain a verdict to moderators.
+        """
+        return self.flag_reason(text) is not None
+
+    def flag_reason(self, text: str):
+        """
+        The fast verdict as the reason of the first check that fired, or
+        None for a safe comment. Reasons read as in classify_comment.
+        """
+        profiler = self.profiler
+        if profiler is not None and not profiler.should_sample():
+            profiler = None
+        run = self._run
+
+        length_reason = run(profiler, "length", self._check_length, text)
+        if length_reason:
+            return length_reason
+
+        text_lower = text.lower()
+        for word in self.OFFENSIVE_KEYWORDS:
+            if run(profiler, f"keyword: {word}", text_lower.__contains__, word):
+                return f"Contains keywords: {word}"
+
+        pattern_reason = self._first_pattern(profiler, text)
+        if pattern_reason:
+            return pattern_reason
+
+        if run(profiler, "punctuation", self._excessive_punctuation, text):
+            return "Excessive punctuation"
+
+        if self.near_duplicates is not None:
+            score = run(profiler, "near_duplicate", self._near_duplicate_score, text)
+            if score is not None:
+                return f"Near-duplicate of flagged comment ({score:.0%} similar)"
+
+        return None
+
+    def _first_pattern(self, profiler, text):
+        """The reason for the first spam pattern ``text`` matches, if any."""
+        deadline = time.perf_counter() + self.PATTERN_TIME_BUDGET
+        for pattern, regex in self.compiled_patterns:
+            if time.perf_counter() > deadline:
+                return "Spam pattern checks timed out"
+            if self._run(profiler, f"pattern: {pattern}", regex.search, text):
+                return f"Matches spam pattern: {pattern}"
+        return None
+
+    def warm_up(self):
+        """
+        Do one-off loading up front instead of on the first request.
+
+        Subclasses that load models should do it here (and call super()).
+        """
+        if self.near_duplicates is not None:
+            self.near_duplicates.refresh(force=True)
+        self.classify_comment("Warm-up comment to exercise every check.")
+
+    @staticmethod
+    def _run(profiler, rule, check, *args):
+        """Run one rule, timing it when this call is being profiled."""
+        if profiler is None:
+            return check(*args)
+        start = time.perf_counter()
+        result = check(*args)
+        profiler.record(rule, time.perf_counter() - start, result)
+        return result
+
+    @staticmethod
+    def _check_length(text):
+        # Only short texts are stripped, so long ones are never copied.
+        if len(text) <= MAX_COMMENT_LENGTH and len(text.strip()) < 3:
+            return "Comment too short"
+        if len(text) > MAX_COMMENT_LENGTH:
+            return "Comment unusually long"
+        return None
+
+    @staticmethod
+    def _excessive_punctuation(text):
+        # str.count runs in C, one pass per character
+        punct_ratio = sum(map(text.count, "!?.,;:")) / max(len(text), 1)
+        return punct_ratio > 0.2
+
+    def _near_duplicate_score(self, text):
+        return self.near_duplicates.best_match(minhash(text))
+
 
 class MLClassificationService(ClassificationService):
     """
     Extended classification service using ML models.
 
-    This is a placeholder showing how to extend the base service
-    with actual ML models (Hugging Face, OpenAI, etc.)
+    Runs the rule-based checks and, when a model artifact is configured
+    (``artifact_path``, default MODEL_ARTIFACT_PATH), also flags comments
+    the hashed spam model scores at or above its threshold. The artifact
+    is memory-mapped (see artifacts.py), so every worker shares one copy of
+    the weights, and publishing a new version at the same path is picked
+    up within MODEL_ARTIFACT_CHECK_SECONDS without a restart.
+
+    This also shows how to extend the base service with other models
+    (Hugging Face, OpenAI, etc.)
     """
 
-    def __init__(self, model_name=None):
+    def __init__(
+        self, model_name=None, near_duplicates=None, profiler=None, artifact_path=None
+    ):
         """
         Initialize with optional model.
 
@@ -108,10 +271,34 @@ class MLClassificationService(ClassificationService):
             model="distilbert-base-uncased-finetuned-sst-2-english"
         )
         """
-        super().__init__()
+        super().__init__(near_duplicates=near_duplicates, profiler=profiler)
         self.model_name = model_name
+        if artifact_path is None:
+            artifact_path = getattr(settings, "MODEL_ARTIFACT_PATH", None)
+        self.artifacts = (
+            ArtifactWatcher(
+                artifact_path,
+                check_seconds=getattr(settings, "MODEL_ARTIFACT_CHECK_SECONDS", 10),
+            )
+            if artifact_path
+            else None
+        )
+        self._model = None
         # self.classifier = None  # Placeholder for ML model
 
+    @property
+    def model(self):
+        """The HashedLinearModel for the current artifact, or None."""
+        if self.artifacts is None:
+            return None
+        artifact = self.artifacts.current()
+        model = self._model
+        if artifact is None:
+            return None
+        if model is None or model.artifact is not artifact:
+            model = self._model = HashedLinearModel(artifact)
+        return model
+
     def classify_comment(self, text: str) -> dict:
         """
         Classify using ML model, fallback to rule-based.
@@ -121,10 +308,20 @@ class MLClassificationService(ClassificationService):
         - OpenAI Moderation API
         - Custom trained models
         """
-        # For now, use rule-based classification
         result = super().classify_comment(text)
 
-        # Future: Add ML model prediction
+        model = self.model
+        if model is not None:
+            score = model.score(text)
+            result["ml_score"] = score
+            result["model_version"] = model.version
+            if score >= model.threshold:
+                result["reasons"].append(f"Spam model score ({score:.2f})")
+                result["classification"] = "needs_review"
+                result["confidence"] = min(len(result["reasons"]) * 0.3, 1.0)
+                result["flagged"] = True
+
+        # Future: Add other model predictions (flag_reason would call them too)
         # if self.classifier:
         #     ml_result = self.classifier(text)[0]
         #     result['ml_label'] = ml_result['label']
@@ -132,9 +329,77 @@ class MLClassificationService(ClassificationService):
 
         return result
 
+    def flag_reason(self, text: str):
+        reason = super().flag_reason(text)
+        if reason is not None:
+            return reason
+        model = self.model
+        if model is not None:
+            score = model.score(text)
+            if score >= model.threshold:
+                return f"Spam model score ({score:.2f})"
+        return None
+
+    def warm_up(self):
+        """
+        Load the model before serving traffic.
+
+        With gunicorn's preload_app this runs once in the master, so every
+        worker starts with the artifact already mapped.
+        """
+        # Future: load other models here instead of in __init__
+        # self.classifier = pipeline("sentiment-analysis", model=self.model_name)
+        # self.classifier("warm-up")
+        if self.artifacts is not None:
+            self.artifacts.current()
+        super().warm_up()
+
+
+# Singleton instance, built on first use so management commands that never
+# classify don't pay for it. Under gunicorn it is built and warmed up once
+# in the master (see gunicorn.conf.py) and shared by the forked workers.
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> ClassificationService:
+    """The app-wide classifier, as configured by CLASSIFIER_SERVICE."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                service_class = import_string(
+                    getattr(
+                        settings,
+                        "CLASSIFIER_SERVICE",
+                        "blog.classification.ClassificationService",
+                    )
+                )
+                _classifier = service_class(
+                    near_duplicates=NearDuplicateIndex(
+                        capacity=getattr(settings, "NEAR_DUPLICATE_CAPACITY", 100_000),
+                        threshold=getattr(settings, "NEAR_DUPLICATE_THRESHOLD", 0.6),
+                        loader=recent_flagged_comments,
+                        log=SignatureLog(),
+                        # Keeps the first fill off the request path when
+                        # gunicorn doesn't preload it (see gunicorn.conf.py).
+                        background=True,
+                    ),
+                    profiler=RuleProfiler(
+                        sample_rate=getattr(
+                            settings, "CLASSIFIER_PROFILE_SAMPLE_RATE", 0
+                        ),
+                        export=True,
+                    ),
+                )
+    return _classifier
 
-# Singleton instance
-_classifier = ClassificationService()
+
+def warm_up() -> ClassificationService:
+    """Build the classifier and do its one-off loading now rather than per request."""
+    classifier = get_classifier()
+    classifier.warm_up()
+    return classifier
 
 
 def classify_comment(text: str) -> dict:
@@ -147,4 +412,42 @@ def classify_comment(text: str) -> dict:
         if result['flagged']:
             # Handle flagged comment
     """
-    return _classifier.classify_comment(text)
+    start = time.perf_counter()
+    result = get_classifier().classify_comment(text)
+    observe_classification(result, time.perf_counter() - start)
+    return result
+
+
+def is_flagged(text: str) -> bool:
+    """
+    Convenience function for the fast verdict, for write paths that only
+    need to know whether a comment goes to review.
+    """
+    start = time.perf_counter()
+    reason = get_classifier().flag_reason(text)
+    observe_verdict(reason, time.perf_counter() - start)
+    return reason is not None
+
+
+def record_flagged(text: str, share: bool = False) -> None:
+    """
+    Remember a flagged comment so near-copies of it are flagged too.
+
+    Other worker processes pick up newly created comments on their next
+    index refresh. Pass ``share=True`` for older comments a moderator
+    flags, which only reach them through the shared log.
+    """
+    near_duplicates = get_classifier().near_duplicates
+    if near_duplicates is not None:
+        near_duplicates.add(minhash(text), share=share)
+
+
+def forget_flagged(text: str) -> None:
+    """
+    Stop treating a comment a moderator marked as safe as known spam.
+
+    Other worker processes follow on their next index refresh.
+    """
+    near_duplicates = get_classifier().near_duplicates
+    if near_duplicates is not None:
+        near_duplicates.discard(minhash(text), share=True)
@@ -0,0 +1,11 @@
+"""
+Comment length limit shared by the classifier and the features it computes.
+
+Defined apart from classification.py, which imports the modules that also
+need it.
+"""
+
+# Longer comments are flagged as unusually long, and only this many leading
+# characters are fingerprinted or scored, so oversized comments cost no more
+# to classify than ones within the limit.
+MAX_COMMENT_LENGTH = 1000
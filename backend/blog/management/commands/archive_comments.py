@@ -0,0 +1,117 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blog.models import ArchivedComment, Comment, Post
+from smart_comments.db.replicas import use_primary
+
+FIELDS = ["id", "post_id", "author", "text", "flagged", "overridden", "created_at"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves comments older than a cutoff into the archive table in small "
+        "transactions, keeping the per-post counters right"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            required=True,
+            metavar="DAYS",
+            help="Archive comments created more than this many days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Comments moved per transaction",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to pause between batches, to leave room for other writers",
+        )
+        parser.add_argument(
+            "--keep-flagged",
+            action="store_true",
+            help="Leave flagged comments in the review queue",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many comments would be archived",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than"] < 0:
+            raise CommandError("--older-than must not be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        cutoff = timezone.now() - timedelta(days=options["older_than"])
+        candidates = Comment.objects.filter(created_at__lt=cutoff)
+        if options["keep_flagged"]:
+            candidates = candidates.filter(flagged=False)
+
+        # Replicas may lag; decide what to move from the primary.
+        with use_primary():
+            if options["dry_run"]:
+                self.stdout.write(
+                    f"{candidates.count()} comment(s) older than {cutoff:%Y-%m-%d} "
+                    "would be archived."
+                )
+                return
+
+            moved = 0
+            start = time.perf_counter()
+            while True:
+                batch = self.archive_batch(candidates, options["batch_size"])
+                if not batch:
+                    break
+                moved += batch
+                self.stdout.write(f"Archived {moved} comment(s)...")
+                if options["sleep"]:
+                    time.sleep(options["sleep"])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {moved} comment(s) older than {cutoff:%Y-%m-%d} "
+                f"in {elapsed:.2f}s."
+            )
+        )
+
+    @staticmethod
+    def archive_batch(candidates, batch_size):
+        """Move the oldest ``batch_size`` candidates in one short transaction."""
+        with transaction.atomic():
+            # Locked so a moderator can't change a row's flag between reading
+            # it here and deleting it below.
+            rows = list(
+                candidates.select_for_update()
+                .order_by("created_at", "id")
+                .values(*FIELDS)[:batch_size]
+            )
+            if not rows:
+                return 0
+            ArchivedComment.objects.bulk_create(ArchivedComment(**row) for row in rows)
+
+            totals = Counter(row["post_id"] for row in rows)
+            flagged = Counter(row["post_id"] for row in rows if row["flagged"])
+            for post_id, count in totals.items():
+                Post.objects.filter(pk=post_id).update(
+                    archived_comment_count=F("archived_comment_count") + count,
+                    archived_flagged_count=F("archived_flagged_count")
+                    + flagged[post_id],
+                )
+
+            Comment.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        return len(rows)
@@ -0,0 +1,96 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+PROFILES = {
+    "default": "django.db.backends.sqlite3",
+    "tuned": "smart_comments.db.sqlite3",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent comment-style writes against a scratch SQLite "
+        "database with Django's default settings and with the tuned profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--writes", type=int, default=200, help="Write transactions per thread"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads x {options['writes']} write transactions"
+        )
+        for profile, engine in PROFILES.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                elapsed, committed, locked = self.run_profile(
+                    profile, engine, Path(tmp) / "bench.sqlite3", **options
+                )
+            attempted = committed + locked
+            self.stdout.write(
+                f"  {profile:<8} {committed / elapsed:>9.0f} writes/s  "
+                f"{locked} locked ({locked / max(attempted, 1):.1%})  "
+                f"{elapsed:.2f}s"
+            )
+
+    def run_profile(self, profile, engine, path, threads, writes, **options):
+        alias = f"benchmark_{profile}"
+        connections.settings[alias] = connections.configure_settings(
+            {"default": {"ENGINE": engine, "NAME": str(path)}}
+        )["default"]
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE bench_comment ("
+                "id INTEGER PRIMARY KEY, post_id INTEGER, text TEXT)"
+            )
+
+        results = []
+        lock = threading.Lock()
+
+        def writer(worker):
+            committed = locked = 0
+            for i in range(writes):
+                try:
+                    # Mirrors a comment POST: read the post's state, then insert.
+                    with transaction.atomic(using=alias):
+                        with connections[alias].cursor() as cursor:
+                            cursor.execute(
+                                "SELECT COUNT(*) FROM bench_comment WHERE post_id = %s",
+                                [worker],
+                            )
+                            cursor.execute(
+                                "INSERT INTO bench_comment (post_id, text) "
+                                "VALUES (%s, %s)",
+                                [worker, f"comment {i} from writer {worker}"],
+                            )
+                    committed += 1
+                except OperationalError:
+                    locked += 1
+            connections[alias].close()
+            with lock:
+                results.append((committed, locked))
+
+        workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+        return (
+            elapsed,
+            sum(committed for committed, _ in results),
+            sum(locked for _, locked in results),
+        )
@@ -0,0 +1,98 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from blog.models import Comment
+from blog.profiling import RuleProfiler
+from blog.similarity import NearDuplicateIndex, minhash, recent_flagged_comments
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays stored comments through an instrumented classifier and "
+        "reports the slowest and most frequently hit rules"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Replay at most this many comments"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Replay every comment this many times"
+        )
+        parser.add_argument("--top", type=int, default=10, help="Rules per ranking")
+
+    def handle(self, *args, **options):
+        profiler = RuleProfiler(sample_rate=1.0)
+        service_class = import_string(
+            getattr(
+                settings,
+                "CLASSIFIER_SERVICE",
+                "blog.classification.ClassificationService",
+            )
+        )
+        service = service_class(
+            near_duplicates=NearDuplicateIndex(
+                capacity=getattr(settings, "NEAR_DUPLICATE_CAPACITY", 100_000),
+                threshold=getattr(settings, "NEAR_DUPLICATE_THRESHOLD", 0.6),
+                loader=recent_flagged_comments,
+            ),
+            profiler=profiler,
+        )
+        # Load the index up front so its build isn't charged to a rule.
+        index = service.near_duplicates
+        index.refresh()
+
+        texts = Comment.objects.order_by("-id").values_list("text", flat=True)
+        if options["limit"]:
+            texts = texts[: options["limit"]]
+
+        replayed = 0
+        start = time.perf_counter()
+        for text in texts.iterator(chunk_size=2000):
+            # A flagged comment is in the index itself; take it out while it
+            # is replayed so it isn't reported as a near-copy of itself.
+            signature = minhash(text)
+            own = signature is not None and signature in index
+            if own:
+                index.discard(signature)
+            for _ in range(options["repeat"]):
+                service.classify_comment(text)
+                replayed += 1
+            if own:
+                index.add(signature)
+        elapsed = time.perf_counter() - start
+
+        if not replayed:
+            self.stdout.write(self.style.WARNING("No comments to replay."))
+            return
+
+        self.stdout.write(
+            f"Replayed {replayed} classifications in {elapsed:.2f}s "
+            f"({elapsed / replayed * 1e6:.1f} us each, including profiling)"
+        )
+        stats = profiler.report()
+        total = sum(rule.seconds for rule in stats) or 1
+
+        self.stdout.write(self.style.SUCCESS("\nSlowest rules (total time):"))
+        self.stdout.write(
+            f"  {'rule':<40} {'total ms':>10} {'share':>7} {'mean us':>9} {'hits':>8}"
+        )
+        for rule in sorted(stats, key=lambda r: r.seconds, reverse=True)[
+            : options["top"]
+        ]:
+            self.stdout.write(
+                f"  {rule.rule:<40} {rule.seconds * 1e3:>10.2f} "
+                f"{rule.seconds / total:>7.1%} {rule.mean_us:>9.2f} {rule.hits:>8}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("\nMost frequently hit rules:"))
+        self.stdout.write(f"  {'rule':<40} {'hits':>8} {'hit rate':>9}")
+        for rule in sorted(stats, key=lambda r: r.hits, reverse=True)[: options["top"]]:
+            if not rule.hits:
+                break
+            self.stdout.write(
+                f"  {rule.rule:<40} {rule.hits:>8} {rule.hits / rule.calls:>9.1%}"
+            )
@@ -0,0 +1,500 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog import stats
+from blog.classification import get_classifier, warm_up
+from blog.models import Comment, Post
+from smart_comments.db.replicas import use_primary
+
+AUTHOR_MAX_LENGTH = Comment._meta.get_field("author").max_length
+# Column order of the rows built by RowBuilder.
+COLUMNS = ["post_id", "author", "text", "created_at", "flagged", "overridden"]
+# Escapes for Postgres' COPY text format.
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+
+class Rejected(Exception):
+    """A record that cannot be imported, with the reason as its message."""
+
+
+class Batch:
+    """What a worker makes of one chunk of lines, ready to be inserted."""
+
+    def __init__(self, end_offset, rows, count, counts, rejects):
+        self.end_offset = end_offset
+        # A list of row tuples, or the chunk as COPY text for Postgres.
+        self.rows = rows
+        self.count = count
+        # Daily rollup deltas, {(post_id, date): [total, flagged, overridden]}.
+        self.counts = counts
+        # Lines for the --rejects file.
+        self.rejects = rejects
+
+
+class RowBuilder:
+    """
+    Turns raw lines into database rows: parses, validates, classifies.
+
+    Runs in the worker processes, so the importing process only reads lines
+    and writes rows.
+    """
+
+    def __init__(self, fmt, header, post_ids, post_titles, classify, alias):
+        self.fmt = fmt
+        self.header = header
+        self.post_ids = post_ids
+        self.post_titles = post_titles
+        self.classify = classify
+        self.alias = alias
+        self.copy = connections[alias].vendor == "postgresql"
+
+    def __call__(self, lines):
+        """A Batch for ``lines``, a list of ``(end_offset, raw)`` pairs."""
+        rows = []
+        counts = {}
+        rejects = []
+        classifier = get_classifier() if self.classify else None
+        adapt = connections[self.alias].ops.adapt_datetimefield_value
+        for end_offset, raw in lines:
+            try:
+                post_id, author, text, created_at, flagged = self.build(
+                    _parse(raw, self.fmt, self.header)
+                )
+            except Rejected as exc:
+                rejects.append(_reject_entry(end_offset - len(raw), raw, exc))
+                continue
+            if classifier is not None:
+                flagged = classifier.is_flagged(text)
+            row = counts.setdefault(
+                (post_id, timezone.localdate(created_at)), [0, 0, 0]
+            )
+            row[0] += 1
+            row[1] += flagged
+            if self.copy:
+                created_at = created_at.isoformat()
+            else:
+                created_at = adapt(created_at)
+            rows.append((post_id, author, text, created_at, flagged, False))
+        count = len(rows)
+        if self.copy:
+            rows = "".join(_copy_line(row) for row in rows)
+        return Batch(lines[-1][0] if lines else None, rows, count, counts, rejects)
+
+    def build(self, record):
+        """A row for ``record`` (before classification), or raise Rejected."""
+        if isinstance(record, Rejected):
+            raise record
+        flagged = record.get("flagged", False)
+        if isinstance(flagged, str):
+            flagged = flagged.strip().lower() in ("1", "true", "yes")
+        return (
+            self.post_id(record),
+            self.author(record),
+            self.text(record),
+            self.created_at(record),
+            bool(flagged),
+        )
+
+    def post_id(self, record):
+        post_id = record.get("post")
+        if post_id in (None, ""):
+            title = record.get("post_title")
+            if not title:
+                raise Rejected("missing post or post_title")
+            if title not in self.post_titles:
+                raise Rejected(f"no post titled {title!r}")
+            return self.post_titles[title]
+        try:
+            post_id = int(post_id)
+        except (TypeError, ValueError):
+            raise Rejected(f"invalid post id {post_id!r}")
+        if post_id not in self.post_ids:
+            raise Rejected(f"no post with id {post_id}")
+        return post_id
+
+    @staticmethod
+    def author(record):
+        author = record.get("author")
+        if not isinstance(author, str) or not author.strip():
+            raise Rejected("missing author")
+        if len(author) > AUTHOR_MAX_LENGTH:
+            raise Rejected(f"author longer than {AUTHOR_MAX_LENGTH} characters")
+        return author
+
+    @staticmethod
+    def text(record):
+        text = record.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise Rejected("missing text")
+        return text
+
+    @staticmethod
+    def created_at(record):
+        value = record.get("created_at")
+        if not value:
+            return timezone.now()
+        try:
+            created_at = parse_datetime(value)
+        except (TypeError, ValueError):
+            created_at = None
+        if created_at is None:
+            raise Rejected(f"invalid created_at {value!r}")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+        return created_at
+
+
+# The worker's RowBuilder, set by _init_worker.
+_builder = None
+
+
+def _init_worker(builder):
+    global _builder
+    # A no-op when the pool forks from an already set up process.
+    django.setup()
+    _builder = builder
+
+
+def _build_rows(lines):
+    return _builder(lines)
+
+
+def _copy_line(row):
+    post_id, author, text, created_at, flagged, overridden = row
+    return (
+        f"{post_id}\t{author.translate(_COPY_ESCAPES)}\t"
+        f"{text.translate(_COPY_ESCAPES)}\t{created_at}\t"
+        f"{'t' if flagged else 'f'}\t{'t' if overridden else 'f'}\n"
+    )
+
+
+def _reject_entry(offset, raw, exc):
+    """The line recording a rejected record in the --rejects file."""
+    entry = {
+        "offset": offset,
+        "error": str(exc),
+        "record": raw.decode("utf-8", "replace").rstrip("\r\n"),
+    }
+    return json.dumps(entry).encode() + b"\n"
+
+
+def _skip_to(stream, position, offset):
+    """Advance ``stream`` from byte ``position`` to byte ``offset``."""
+    if offset <= position:
+        return position
+    if stream.seekable():
+        stream.seek(offset)
+        return offset
+    while position < offset:
+        chunk = stream.read(min(1 << 20, offset - position))
+        if not chunk:
+            break
+        position += len(chunk)
+    return position
+
+
+def _parse(line, fmt, header):
+    """The record on ``line``, or a Rejected exception."""
+    try:
+        text = line.decode("utf-8")
+        if fmt == "jsonl":
+            record = json.loads(text)
+            if not isinstance(record, dict):
+                raise Rejected("not a JSON object")
+            return record
+        # read_lines only ends a CSV record early at the end of the input.
+        if line.count(b'"') % 2:
+            raise Rejected("unterminated quoted field")
+        values = next(csv.reader([text]))
+        if len(values) != len(header):
+            raise Rejected(f"expected {len(header)} columns, found {len(values)}")
+        return dict(zip(header, values))
+    except Rejected as exc:
+        return exc
+    except (UnicodeDecodeError, ValueError, csv.Error) as exc:
+        return Rejected(str(exc))
+
+
+def read_header(stream, fmt):
+    """``(header, size)``: a CSV file's column names and their size in bytes."""
+    if fmt != "csv":
+        return None, 0
+    line = stream.readline()
+    return next(csv.reader([line.decode("utf-8-sig")]), None), len(line)
+
+
+def read_lines(stream, fmt, position, start_offset=0):
+    """
+    Yield ``(end_offset, raw)`` for every record in a binary stream.
+
+    ``position`` is the stream's byte offset so far. ``end_offset`` is the
+    byte offset just past the record, so reading can resume there. Records
+    are only split here (a CSV record may span lines); parsing them is left
+    to the workers.
+    """
+    position = _skip_to(stream, position, start_offset)
+    pending = b""
+    for line in stream:
+        position += len(line)
+        if fmt == "csv":
+            pending += line
+            # An odd number of quotes means a quoted field spans lines.
+            if pending.count(b'"') % 2:
+                continue
+            line, pending = pending, b""
+        if line.strip():
+            yield position, line
+    if pending:
+        yield position, pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams comments from a JSONL or CSV file (or stdin) into the database, "
+        "parsing and classifying them in a process pool. Each record needs author, text and "
+        "either post (id) or post_title; created_at and, with --no-classify, "
+        "flagged are optional."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin")
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="Input format (default: from the file extension, else jsonl)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help=(
+                "Processes that parse and classify records "
+                "(default: one per CPU; 0 does it inline)"
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Records sent to a worker process at a time",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per executemany call (Postgres loads each chunk with COPY)",
+        )
+        parser.add_argument(
+            "--transaction-size",
+            type=int,
+            default=10_000,
+            help="Comments committed per transaction (rounded up to whole chunks)",
+        )
+        parser.add_argument(
+            "--start-offset",
+            type=int,
+            default=0,
+            help="Byte offset to resume from, as printed by a previous run",
+        )
+        parser.add_argument(
+            "--rejects", help="Append rejected records with the reason to this file"
+        )
+        parser.add_argument(
+            "--no-classify",
+            action="store_true",
+            help="Keep each record's flagged value instead of classifying",
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=float,
+            default=5.0,
+            help="Seconds between progress reports",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("chunk_size", "batch_size", "transaction_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+
+        with use_primary():
+            posts = Post.objects.order_by("-id").values_list("id", "title")
+            post_ids = set()
+            post_titles = {}
+            for post_id, title in posts:
+                post_ids.add(post_id)
+                # Duplicate titles resolve to the oldest post.
+                post_titles[title] = post_id
+
+        workers = options["workers"]
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        try:
+            stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        self.rejects = open(options["rejects"], "ab") if options["rejects"] else None
+        self.imported = self.rejected = 0
+        self.committed_offset = options["start_offset"]
+        self.started = self.reported = time.perf_counter()
+        pool = None
+        try:
+            header, position = read_header(stream, fmt)
+            if fmt != "csv" or header:
+                builder = RowBuilder(
+                    fmt,
+                    header,
+                    post_ids,
+                    post_titles,
+                    not options["no_classify"],
+                    DEFAULT_DB_ALIAS,
+                )
+                pool = self.start_pool(workers, builder)
+                self.run(
+                    read_lines(stream, fmt, position, options["start_offset"]),
+                    pool or builder,
+                    2 * max(workers, 1),
+                    options,
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Interrupted."))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if stream is not sys.stdin.buffer:
+                stream.close()
+            if self.rejects is not None:
+                self.rejects.close()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.imported} comment(s), rejected {self.rejected}, "
+                f"in {elapsed:.1f}s ({self.imported / max(elapsed, 1e-9):.0f}/s). "
+                f"Committed up to byte {self.committed_offset}; resume with "
+                f"--start-offset {self.committed_offset}."
+            )
+        )
+
+    def start_pool(self, workers, builder):
+        if builder.classify:
+            # Load the classifier (and its near-duplicate index) once, so
+            # forked workers inherit it instead of each loading their own.
+            warm_up()
+        if workers == 0:
+            return None
+        # Connections must not be shared with the forked workers.
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(builder,)
+        )
+
+    def run(self, lines, pool, max_in_flight, options):
+        """
+        Build and insert rows for ``lines``, keeping a few chunks in flight.
+
+        ``pool`` is a ProcessPoolExecutor, or the RowBuilder itself to build
+        rows in this process.
+        """
+        in_flight = deque()
+        self.buffer = []
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= options["chunk_size"]:
+                in_flight.append(self.submit(pool, chunk))
+                chunk = []
+                self.drain(in_flight, max_in_flight, options)
+        if chunk:
+            in_flight.append(self.submit(pool, chunk))
+        self.drain(in_flight, 0, options)
+        self.flush(options)
+
+    @staticmethod
+    def submit(pool, chunk):
+        if isinstance(pool, RowBuilder):
+            return pool(chunk)
+        return pool.submit(_build_rows, chunk)
+
+    def drain(self, in_flight, limit, options):
+        """Buffer built chunks until at most ``limit`` are in flight."""
+        while len(in_flight) > limit:
+            batch = in_flight.popleft()
+            if not isinstance(batch, Batch):
+                batch = batch.result()
+            self.buffer.append(batch)
+            if sum(b.count for b in self.buffer) >= options["transaction_size"]:
+                self.flush(options)
+
+    def flush(self, options):
+        """Commit the buffered rows, then record the rejects among them."""
+        if not self.buffer:
+            return
+        counts = {}
+        for batch in self.buffer:
+            for key, (total, flagged, overridden) in batch.counts.items():
+                row = counts.setdefault(key, [0, 0, 0])
+                row[0] += total
+                row[1] += flagged
+                row[2] += overridden
+        with transaction.atomic():
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                for batch in self.buffer:
+                    self.insert(cursor, batch.rows, options["batch_size"])
+            stats.counts_added(counts)
+        # Only written once committed, so resuming from committed_offset
+        # doesn't reject the same records again.
+        rejects = [entry for batch in self.buffer for entry in batch.rejects]
+        if self.rejects is not None and rejects:
+            self.rejects.writelines(rejects)
+            self.rejects.flush()
+        self.imported += sum(batch.count for batch in self.buffer)
+        self.rejected += len(rejects)
+        self.committed_offset = self.buffer[-1].end_offset
+        self.buffer = []
+        self.report(options)
+
+    @staticmethod
+    def insert(cursor, rows, batch_size):
+        """Insert a batch's rows: COPY text on Postgres, else row tuples."""
+        if not rows:
+            return
+        table = Comment._meta.db_table
+        if isinstance(rows, str):
+            sql = f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN"
+            if hasattr(cursor, "copy_expert"):  # psycopg2
+                cursor.copy_expert(sql, io.StringIO(rows))
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(rows)
+            return
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            table, ", ".join(COLUMNS), ", ".join(["%s"] * len(COLUMNS))
+        )
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start : start + batch_size])
+
+    def report(self, options):
+        now = time.perf_counter()
+        if now - self.reported >= options["progress_every"]:
+            self.reported = now
+            elapsed = now - self.started
+            self.stdout.write(
+                f"Imported {self.imported}, rejected {self.rejected}, "
+                f"{self.imported / elapsed:.0f}/s, committed up to byte "
+                f"{self.committed_offset}"
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import stats
+from smart_comments.db.replicas import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the daily moderation stats from the live and archived "
+        "comments (backfill, or repair after drift)"
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with use_primary():
+            rows = stats.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {rows} daily stats row(s) in "
+                f"{time.perf_counter() - start:.2f}s."
+            )
+        )
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 
+from blog import stats
 from blog.classification import classify_comment
 from blog.models import Comment, Post
 
@@ -123,30 +124,33 @@ class Command(BaseCommand):
         # Create comments for each post
         for comment_data in comments_post1_safe + comments_post1_flagged:
             result = classify_comment(comment_data["text"])
-            Comment.objects.create(
+            comment = Comment.objects.create(
                 post=post1,
                 author=comment_data["author"],
                 text=comment_data["text"],
                 flagged=result["flagged"],
             )
+            stats.comments_added([comment])
 
         for comment_data in comments_post2_safe + comments_post2_flagged:
             result = classify_comment(comment_data["text"])
-            Comment.objects.create(
+            comment = Comment.objects.create(
                 post=post2,
                 author=comment_data["author"],
                 text=comment_data["text"],
                 flagged=result["flagged"],
             )
+            stats.comments_added([comment])
 
         for comment_data in comments_post3_safe + comments_post3_flagged:
             result = classify_comment(comment_data["text"])
-            Comment.objects.create(
+            comment = Comment.objects.create(
                 post=post3,
                 author=comment_data["author"],
                 text=comment_data["text"],
                 flagged=result["flagged"],
             )
+            stats.comments_added([comment])
 
         # Summary
         total_posts = Post.objects.count()
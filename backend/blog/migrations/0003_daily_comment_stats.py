@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-19 14:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0002_archived_comments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedcomment",
+            name="overridden",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="overridden",
+            field=models.BooleanField(
+                default=False,
+                help_text="True if a moderator reversed the automatic verdict",
+            ),
+        ),
+        migrations.CreateModel(
+            name="DailyCommentStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("total", models.IntegerField(default=0)),
+                ("flagged", models.IntegerField(default=0)),
+                ("overridden", models.IntegerField(default=0)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="blog.post",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date", "post_id"],
+                "indexes": [
+                    models.Index(fields=["date"], name="blog_dailyc_date_9824f6_idx")
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailycommentstats",
+            constraint=models.UniqueConstraint(
+                fields=("post", "date"), name="unique_post_day"
+            ),
+        ),
+    ]
@@ -10,6 +10,10 @@ class Post(models.Model):
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Comments moved to ArchivedComment, so totals stay right without
+    # counting the archive.
+    archived_comment_count = models.PositiveIntegerField(default=0)
+    archived_flagged_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ["-created_at"]
@@ -27,10 +31,65 @@ class Comment(models.Model):
     flagged = models.BooleanField(
         default=False, help_text="True if comment needs review"
     )
+    overridden = models.BooleanField(
+        default=False, help_text="True if a moderator reversed the automatic verdict"
+    )
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["created_at"])]
 
     def __str__(self):
         return f"Comment by {self.author} on {self.post.title}"
+
+
+class ArchivedComment(models.Model):
+    """
+    Comment moved out of the hot table by ``manage.py archive_comments``.
+
+    Keeps the original id, so links to a comment can be followed into the
+    archive.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="archived_comments"
+    )
+    author = models.CharField(max_length=100)
+    text = models.TextField()
+    flagged = models.BooleanField(default=False)
+    overridden = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"Archived comment by {self.author} on {self.post.title}"
+
+
+class DailyCommentStats(models.Model):
+    """
+    Comment counts per post per day, kept up to date by blog.stats.
+
+    ``flagged`` and ``overridden`` are current counts: they follow
+    moderators changing a comment's flag after it was posted.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    total = models.IntegerField(default=0)
+    flagged = models.IntegerField(default=0)
+    overridden = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["date", "post_id"]
+        constraints = [
+            models.UniqueConstraint(fields=["post", "date"], name="unique_post_day")
+        ]
+        indexes = [models.Index(fields=["date"])]
+
+    def __str__(self):
+        return f"Stats for {self.post.title} on {self.date}"
@@ -0,0 +1,101 @@
+"""
+Load-time safety checks for spam regexes.
+
+Python's ``re`` is a backtracking engine with no timeout, so one pattern
+with the wrong shape lets a crafted comment pin a worker for seconds or
+minutes. Patterns are parsed when the classifier is created and rejected
+if they contain the shapes that cause super-linear matching:
+
+- nested unbounded quantifiers, e.g. ``(a+)+`` (exponential)
+- alternation under an unbounded quantifier, e.g. ``(a|ab)*`` (exponential
+  when the branches overlap)
+- an unbounded ``.*``/``.+`` followed by more pattern, e.g. ``x.*y``
+  (quadratic under ``re.search``, which retries from every position)
+
+Possessive quantifiers and atomic groups never backtrack and are allowed.
+"""
+
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from re import _parser
+except ImportError:  # Python < 3.11
+    import sre_parse as _parser
+
+_REPEATS = (_parser.MAX_REPEAT, _parser.MIN_REPEAT)
+
+
+def _children(op, av):
+    """Sub-pattern sequences nested in one parsed node."""
+    if op in _REPEATS or op == getattr(_parser, "POSSESSIVE_REPEAT", None):
+        return [av[2]]
+    if op == _parser.SUBPATTERN:
+        return [av[3]]
+    if op == _parser.BRANCH:
+        return av[1]
+    if op in (_parser.ASSERT, _parser.ASSERT_NOT):
+        return [av[1]]
+    if op == getattr(_parser, "ATOMIC_GROUP", None):
+        return [av]
+    if op == _parser.GROUPREF_EXISTS:
+        return [branch for branch in av[1:] if branch is not None]
+    return []
+
+
+_NO_BACKTRACKING = tuple(
+    op
+    for op in (
+        getattr(_parser, "POSSESSIVE_REPEAT", None),
+        getattr(_parser, "ATOMIC_GROUP", None),
+    )
+    if op is not None
+)
+
+
+def _contains(sequence, predicate):
+    for op, av in sequence:
+        if predicate(op, av):
+            return True
+        if op in _NO_BACKTRACKING:
+            continue
+        if any(_contains(child, predicate) for child in _children(op, av)):
+            return True
+    return False
+
+
+def _is_unbounded_repeat(op, av):
+    return op in _REPEATS and av[1] == _parser.MAXREPEAT
+
+
+def _check_sequence(sequence, problems):
+    items = list(sequence)
+    for index, (op, av) in enumerate(items):
+        if _is_unbounded_repeat(op, av):
+            body = av[2]
+            if _contains(body, _is_unbounded_repeat):
+                problems.append("nested unbounded quantifiers")
+            if _contains(body, lambda op, av: op == _parser.BRANCH):
+                problems.append("alternation under an unbounded quantifier")
+            if len(body) == 1 and body[0][0] == _parser.ANY and index < len(items) - 1:
+                problems.append("unbounded wildcard followed by more pattern")
+        for child in _children(op, av):
+            _check_sequence(child, problems)
+
+
+def backtracking_risks(pattern):
+    """Names of the catastrophic-backtracking shapes found in ``pattern``."""
+    problems = []
+    _check_sequence(_parser.parse(pattern), problems)
+    return list(dict.fromkeys(problems))
+
+
+def compile_safe(pattern, flags=0):
+    """Compile ``pattern``, refusing shapes that can backtrack catastrophically."""
+    problems = backtracking_risks(pattern)
+    if problems:
+        raise ImproperlyConfigured(
+            f"Spam pattern {pattern!r} is unsafe: {', '.join(problems)}"
+        )
+    return re.compile(pattern, flags)
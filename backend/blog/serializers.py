@@ -1,7 +1,12 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from .classification import classify_comment
-from .models import Comment, Post
+from . import stats
+from .classification import is_flagged, record_flagged
+from .models import ArchivedComment, Comment, Post
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -12,24 +17,71 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ["id", "post", "author", "text", "flagged", "created_at"]
         read_only_fields = ["flagged", "created_at"]
 
+    def update(self, instance, validated_data):
+        """Keep the moderation stats right if the comment moves to another post."""
+        with transaction.atomic():
+            stats.comments_removed([instance])
+            instance = super().update(instance, validated_data)
+            stats.comments_added([instance])
+        return instance
+
     def create(self, validated_data):
         """
         Create comment and automatically classify it.
         """
         text = validated_data.get("text", "")
 
-        # Classify the comment
-        classification_result = classify_comment(text)
+        # Classify the comment (only the verdict is needed here)
+        validated_data["flagged"] = is_flagged(text)
 
-        # Set flagged based on classification
-        validated_data["flagged"] = classification_result["flagged"]
+        # Create the comment and count it in the moderation stats
+        with transaction.atomic():
+            comment = Comment.objects.create(**validated_data)
+            stats.comments_added([comment])
 
-        # Create and return the comment
-        comment = Comment.objects.create(**validated_data)
+        # Catch near-copies of this comment straight away
+        if comment.flagged:
+            record_flagged(text)
 
         return comment
 
 
+class ArchivedCommentSerializer(serializers.ModelSerializer):
+    """Read-only serializer for archived comments"""
+
+    class Meta:
+        model = ArchivedComment
+        fields = [
+            "id",
+            "post",
+            "author",
+            "text",
+            "flagged",
+            "created_at",
+            "archived_at",
+        ]
+        read_only_fields = fields
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    """Query parameters of the moderation stats endpoint"""
+
+    DEFAULT_DAYS = 30
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    post = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+
+    def validate(self, attrs):
+        end = attrs.setdefault("end", timezone.localdate())
+        start = attrs.setdefault("start", end - timedelta(days=self.DEFAULT_DAYS - 1))
+        if start > end:
+            raise serializers.ValidationError("start must not be after end.")
+        attrs.setdefault("limit", 50)
+        return attrs
+
+
 class PostSerializer(serializers.ModelSerializer):
     """Serializer for Post model with nested comments"""
 
@@ -48,15 +100,17 @@ class PostSerializer(serializers.ModelSerializer):
             "comments",
             "comment_count",
             "flagged_comment_count",
+            "archived_comment_count",
         ]
+        read_only_fields = ["archived_comment_count"]
 
     def get_comment_count(self, obj):
-        """Total number of comments on this post"""
-        return obj.comments.count()
+        """Total number of comments on this post, archived ones included"""
+        return obj.comments.count() + obj.archived_comment_count
 
     def get_flagged_comment_count(self, obj):
-        """Number of flagged comments on this post"""
-        return obj.comments.filter(flagged=True).count()
+        """Number of flagged comments on this post, archived ones included"""
+        return obj.comments.filter(flagged=True).count() + obj.archived_flagged_count
 
 
 class PostListSerializer(serializers.ModelSerializer):
@@ -77,7 +131,7 @@ class PostListSerializer(serializers.ModelSerializer):
         ]
 
     def get_comment_count(self, obj):
-        return obj.comments.count()
+        return obj.comments.count() + obj.archived_comment_count
 
     def get_flagged_comment_count(self, obj):
-        return obj.comments.filter(flagged=True).count()
+        return obj.comments.filter(flagged=True).count() + obj.archived_flagged_count
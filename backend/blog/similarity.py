@@ -0,0 +1,326 @@
+"""
+Near-duplicate detection for comment spam.
+
+Spam campaigns post the same message with small variations, which slips
+past keyword rules and exact matching. Each comment is reduced to a MinHash
+signature over its word bigrams; the fraction of positions two signatures
+agree on estimates the Jaccard similarity of the comments.
+
+Known spam signatures are kept in a bounded in-memory LSH index. Signatures
+are cut into bands and each band is hashed into a table, so a lookup only
+compares against signatures sharing at least one whole band with the query,
+which near-duplicates almost always do and unrelated comments almost never
+do. Lookup cost therefore depends on how many similar comments are indexed,
+not on the size of the index.
+"""
+
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from django.core.cache import cache as default_cache
+from django.db import connections
+
+from .limits import MAX_COMMENT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 2
+MIN_TOKENS = 5
+BANDS = 8
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+
+# Signatures are packed into one int, 32 bits per permutation, which keeps
+# them small and lets two of them be compared with a handful of int ops.
+_LANE_BITS = 32
+_BAND_MASK = (1 << (ROWS * _LANE_BITS)) - 1
+_LANE_LSBS = sum(1 << (i * _LANE_BITS) for i in range(NUM_PERM))
+_MASK64 = (1 << 64) - 1
+
+# Multiply-shift hashing with random odd multipliers stands in for the
+# random permutations.
+_rng = random.Random(1234)
+_MULTIPLIERS = [_rng.getrandbits(64) | 1 for _ in range(NUM_PERM)]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _hash64(shingle):
+    return int.from_bytes(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little"
+    )
+
+
+def minhash(text):
+    """
+    MinHash signature of the word bigrams in ``text``, packed into an int.
+
+    Only the first MAX_COMMENT_LENGTH characters are read. Returns None for
+    texts too short to fingerprint meaningfully.
+    """
+    tokens = _TOKEN_RE.findall(text[:MAX_COMMENT_LENGTH].lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    hashes = [
+        _hash64(" ".join(tokens[i : i + SHINGLE_SIZE]))
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    ]
+    lanes = array(
+        "I", [min([(a * h) & _MASK64 for h in hashes]) >> 32 for a in _MULTIPLIERS]
+    )
+    return int.from_bytes(lanes.tobytes(), "little")
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    # Fold every 32-bit lane of the XOR onto its lowest bit: that bit is set
+    # exactly where the lanes differ.
+    diff = signature ^ other
+    for shift in (16, 8, 4, 2, 1):
+        diff |= diff >> shift
+    return 1 - (diff & _LANE_LSBS).bit_count() / NUM_PERM
+
+
+def _band_keys(signature):
+    return [
+        hash((signature >> (i * ROWS * _LANE_BITS)) & _BAND_MASK) for i in range(BANDS)
+    ]
+
+
+class SignatureLog:
+    """
+    Moderator changes to the index, shared between processes via the cache.
+
+    Every change is stored under a sequence number taken from an atomic
+    counter, and each index replays the changes it hasn't seen yet when it
+    refreshes. The cache must be shared by all workers (e.g. Redis) for
+    changes to reach them; entries expire after ``timeout`` seconds.
+    """
+
+    def __init__(self, cache=None, prefix="near_duplicates:log", timeout=86_400):
+        self.cache = cache or default_cache
+        self.prefix = prefix
+        self.timeout = timeout
+        self._sequence_key = f"{prefix}:seq"
+
+    def position(self):
+        """Sequence number of the latest change."""
+        return self.cache.get(self._sequence_key, 0)
+
+    def append(self, op, signature):
+        """Record ``op`` ("add" or "discard") of ``signature`` for other processes."""
+        try:
+            sequence = self.cache.incr(self._sequence_key)
+        except ValueError:
+            if self.cache.add(self._sequence_key, 1, None):
+                sequence = 1
+            else:
+                sequence = self.cache.incr(self._sequence_key)
+        self.cache.set(f"{self.prefix}:{sequence}", (op, signature), self.timeout)
+
+    def read(self, position, current):
+        """``{sequence: (op, signature)}`` for the changes after ``position``."""
+        keys = {f"{self.prefix}:{n}": n for n in range(position + 1, current + 1)}
+        return {keys[key]: value for key, value in self.cache.get_many(keys).items()}
+
+
+class NearDuplicateIndex:
+    """
+    Bounded LSH index of spam signatures.
+
+    The oldest signatures are evicted once ``capacity`` is reached. When a
+    ``loader`` is given, the index fills itself from it on first use and then
+    pulls newly flagged comments every ``refresh_seconds``, so each worker
+    process sees spam flagged by the others. ``loader(since_id, limit)`` must
+    return up to ``limit`` ``(id, text)`` pairs with ids greater than
+    ``since_id``, newest last.
+
+    Changes made with ``share=True`` (moderators clearing or re-flagging
+    older comments, which the loader can't report) also go to the ``log``,
+    and every index sharing the log applies them on its next refresh.
+
+    Filling the index can take seconds. With ``background=True`` the first
+    fill triggered by a lookup runs in a thread instead, and lookups match
+    against whatever has been loaded so far rather than waiting for it.
+    ``refresh(force=True)`` always loads in the calling thread.
+    """
+
+    def __init__(
+        self,
+        capacity=100_000,
+        threshold=0.6,
+        loader=None,
+        refresh_seconds=30,
+        log=None,
+        background=False,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.log = log
+        self.background = background
+        self._loading = None
+        self._log_position = None
+        self._log_gap = None
+        # Signatures in insertion order, for eviction.
+        self._signatures = OrderedDict()
+        # Per band: band hash -> signature, or a list of them on collisions.
+        self._bands = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._refreshed_at = None
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, signature):
+        return signature in self._signatures
+
+    def add(self, signature, share=False):
+        if signature is None:
+            return
+        if share and self.log is not None:
+            self.log.append("add", signature)
+        with self._lock:
+            if signature in self._signatures:
+                self._signatures.move_to_end(signature)
+                return
+            self._signatures[signature] = None
+            for table, key in zip(self._bands, _band_keys(signature)):
+                bucket = table.get(key)
+                if bucket is None:
+                    table[key] = signature
+                elif isinstance(bucket, list):
+                    bucket.append(signature)
+                else:
+                    table[key] = [bucket, signature]
+            if len(self._signatures) > self.capacity:
+                self._remove(next(iter(self._signatures)))
+
+    def discard(self, signature, share=False):
+        if signature is None:
+            return
+        if share and self.log is not None:
+            self.log.append("discard", signature)
+        with self._lock:
+            if signature in self._signatures:
+                self._remove(signature)
+
+    def _remove(self, signature):
+        del self._signatures[signature]
+        for table, key in zip(self._bands, _band_keys(signature)):
+            bucket = table[key]
+            if isinstance(bucket, list):
+                bucket.remove(signature)
+                if len(bucket) == 1:
+                    table[key] = bucket[0]
+            else:
+                del table[key]
+
+    def best_match(self, signature):
+        """Similarity of the first indexed signature above the threshold, or None."""
+        if signature is None:
+            return None
+        self.refresh()
+        with self._lock:
+            if signature in self._signatures:
+                return 1.0
+            for table, key in zip(self._bands, _band_keys(signature)):
+                bucket = table.get(key)
+                if bucket is None:
+                    continue
+                for candidate in bucket if isinstance(bucket, list) else (bucket,):
+                    score = similarity(signature, candidate)
+                    if score >= self.threshold:
+                        return score
+        return None
+
+    def refresh(self, force=False):
+        """Pull new flagged comments and shared changes if the interval has passed."""
+        if self.loader is None and self.log is None:
+            return
+        loading = self._loading
+        if loading is not None and loading.is_alive():
+            if not force:
+                return
+            loading.join()
+        now = time.monotonic()
+        first = self._refreshed_at is None
+        if not force and not first and now - self._refreshed_at < self.refresh_seconds:
+            return
+        self._refreshed_at = now
+        if first and self.background and not force:
+            self._loading = threading.Thread(
+                target=self._load, name="near-duplicate-load", daemon=True
+            )
+            self._loading.start()
+        else:
+            self._pull()
+
+    def _load(self):
+        try:
+            self._pull()
+        finally:
+            # The thread's own database connection would otherwise stay open.
+            connections.close_all()
+
+    def _pull(self):
+        try:
+            if self.log is not None:
+                self._replay_log()
+            if self.loader is not None:
+                rows = self.loader(self._last_id, self.capacity)
+            else:
+                rows = []
+        except Exception:
+            logger.warning("Could not refresh near-duplicate index", exc_info=True)
+            return
+        for comment_id, text in rows:
+            self.add(minhash(text))
+            self._last_id = max(self._last_id, comment_id)
+
+    def _replay_log(self):
+        current = self.log.position()
+        if self._log_position is None:
+            # Everything logged so far is already reflected in the comments
+            # the loader is about to return.
+            self._log_position = current
+            return
+        changes = self.log.read(self._log_position, current)
+        position = self._log_position
+        for sequence in range(self._log_position + 1, current + 1):
+            if sequence not in changes:
+                # Either expired, or appended but not stored yet: wait for
+                # it for one refresh, then give up on it.
+                if sequence != self._log_gap:
+                    self._log_gap = sequence
+                    break
+                continue
+            op, signature = changes[sequence]
+            if op == "add":
+                self.add(signature)
+            else:
+                self.discard(signature)
+            position = sequence
+        else:
+            position = current
+        self._log_position = position
+
+
+def recent_flagged_comments(since_id, limit):
+    """Loader for NearDuplicateIndex: flagged comments newer than ``since_id``."""
+    from .models import Comment
+
+    rows = (
+        Comment.objects.filter(flagged=True, id__gt=since_id)
+        .order_by("-id")
+        .values_list("id", "text")[:limit]
+    )
+    return list(rows)[::-1]
@@ -0,0 +1,109 @@
+"""
+Hashed linear spam model, stored as a memory-mapped artifact.
+
+Comments are reduced to hashed word unigrams and bigrams (the hashing
+trick: no vocabulary to store, a feature is an index into the weight
+table). The model is a log-odds weight per hashed feature plus a bias,
+trained as multinomial naive Bayes from moderated comments. Scoring a
+comment touches only the weights of its own features, so only those pages
+of the artifact are ever read, however large the table.
+"""
+
+import math
+import re
+import zlib
+from array import array
+
+from .artifacts import ModelArtifact, write_artifact
+from .limits import MAX_COMMENT_LENGTH
+
+_TOKEN_RE = re.compile(r"\w+")
+
+DEFAULT_FEATURES = 1 << 18
+DEFAULT_THRESHOLD = 0.9
+
+
+def features(text, n_features):
+    """
+    Hashed unigram and bigram indexes of ``text`` (``n_features`` is a power
+    of 2). Only the first MAX_COMMENT_LENGTH characters are read.
+    """
+    tokens = _TOKEN_RE.findall(text[:MAX_COMMENT_LENGTH].lower())
+    mask = n_features - 1
+    # crc32, unlike hash(), is the same in every process.
+    indexes = {zlib.crc32(token.encode()) & mask for token in tokens}
+    indexes.update(
+        zlib.crc32(f"{a} {b}".encode()) & mask for a, b in zip(tokens, tokens[1:])
+    )
+    return indexes
+
+
+def train(samples, n_features=DEFAULT_FEATURES, smoothing=1.0):
+    """
+    Fit weights from ``(text, is_spam)`` pairs.
+
+    Returns ``(weights, bias)``: a float32 ``array`` of per-feature log-odds
+    and the log prior odds of spam.
+    """
+    if n_features & (n_features - 1):
+        raise ValueError("n_features must be a power of 2")
+    counts = (array("d", bytes(8 * n_features)), array("d", bytes(8 * n_features)))
+    totals = [0, 0]
+    documents = [0, 0]
+    for text, is_spam in samples:
+        label = int(bool(is_spam))
+        documents[label] += 1
+        row = counts[label]
+        for index in features(text, n_features):
+            row[index] += 1
+            totals[label] += 1
+
+    ham, spam = counts
+    spam_norm = math.log(totals[1] + smoothing * n_features)
+    ham_norm = math.log(totals[0] + smoothing * n_features)
+    weights = array(
+        "f",
+        (
+            math.log(s + smoothing) - spam_norm - math.log(h + smoothing) + ham_norm
+            for s, h in zip(spam, ham)
+        ),
+    )
+    bias = math.log((documents[1] + 1) / (documents[0] + 1))
+    return weights, bias
+
+
+def save(path, weights, bias, version, threshold=DEFAULT_THRESHOLD, **metadata):
+    """Publish a trained model to ``path`` (atomically replacing any old one)."""
+    write_artifact(
+        path,
+        {"weights": weights},
+        {
+            "kind": "hashed_naive_bayes",
+            "version": version,
+            "n_features": len(weights),
+            "bias": bias,
+            "threshold": threshold,
+            **metadata,
+        },
+    )
+
+
+class HashedLinearModel:
+    """Scores comments with the weights of a mapped artifact."""
+
+    def __init__(self, artifact: ModelArtifact):
+        self.artifact = artifact
+        self.weights = artifact["weights"]
+        self.n_features = artifact.metadata["n_features"]
+        self.bias = artifact.metadata["bias"]
+        self.threshold = artifact.metadata["threshold"]
+        self.version = artifact.version
+
+    def score(self, text):
+        """Estimated probability that ``text`` is spam."""
+        weights = self.weights
+        logit = self.bias + sum(
+            weights[index] for index in features(text, self.n_features)
+        )
+        # Clamped so math.exp can't overflow.
+        return 1 / (1 + math.exp(-max(min(logit, 50.0), -50.0)))
@@ -0,0 +1,143 @@
+"""
+Per-post, per-day moderation rollups.
+
+DailyCommentStats holds how many comments each post received each day and
+how many of them are flagged or were overridden by a moderator. Every code
+path that creates comments, changes their flag or deletes them reports the
+change here, so the rollups stay current without rescanning comments and
+the dashboard reads a few hundred small rows. Archiving is not a deletion:
+archived comments keep counting.
+
+``rebuild()`` recomputes everything from the live and archived comment
+tables, for backfills or if the rollups are suspected to have drifted.
+"""
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedComment, Comment, DailyCommentStats
+
+
+def _add(post_id, date, total=0, flagged=0, overridden=0):
+    """Add deltas to one rollup row, creating it if needed."""
+    deltas = {"total": total, "flagged": flagged, "overridden": overridden}
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    rows = DailyCommentStats.objects.filter(post_id=post_id, date=date)
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyCommentStats.objects.create(post_id=post_id, date=date, **deltas)
+    except IntegrityError:
+        # Created concurrently since the update above.
+        rows.update(**changes)
+
+
+def _apply(deltas):
+    for (post_id, date), (total, flagged, overridden) in deltas.items():
+        _add(post_id, date, total, flagged, overridden)
+
+
+def comments_added(comments, sign=1):
+    """Count new (or, with ``sign=-1``, deleted) ``Comment`` instances."""
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for comment in comments:
+        row = deltas[comment.post_id, timezone.localdate(comment.created_at)]
+        row[0] += sign
+        row[1] += sign * comment.flagged
+        row[2] += sign * comment.overridden
+    _apply(deltas)
+
+
+def counts_added(deltas):
+    """
+    Add rollup deltas counted elsewhere, as
+    ``{(post_id, date): [total, flagged, overridden]}``.
+    """
+    _apply(deltas)
+
+
+def comments_removed(comments):
+    """Stop counting deleted ``Comment`` instances."""
+    comments_added(comments, sign=-1)
+
+
+def set_flagged(queryset, flagged):
+    """
+    Set ``flagged`` on the comments in ``queryset`` as a moderator decision.
+
+    Comments whose flag actually changes toggle ``overridden`` (a second
+    reversal restores the automatic verdict), and the rollups are adjusted
+    to match. Returns the number of comments changed.
+    """
+    with transaction.atomic():
+        # Locked so comments archived or deleted meanwhile aren't counted.
+        changing = list(
+            queryset.select_for_update()
+            .exclude(flagged=flagged)
+            .values_list("id", "post_id", "created_at", "overridden")
+        )
+        if not changing:
+            return 0
+        to_override = [pk for pk, _, _, overridden in changing if not overridden]
+        to_restore = [pk for pk, _, _, overridden in changing if overridden]
+        Comment.objects.filter(id__in=to_override).update(
+            flagged=flagged, overridden=True
+        )
+        Comment.objects.filter(id__in=to_restore).update(
+            flagged=flagged, overridden=False
+        )
+
+        deltas = defaultdict(lambda: [0, 0, 0])
+        step = 1 if flagged else -1
+        for _, post_id, created_at, overridden in changing:
+            row = deltas[post_id, timezone.localdate(created_at)]
+            row[1] += step
+            row[2] += -1 if overridden else 1
+        _apply(deltas)
+    return len(changing)
+
+
+def rebuild():
+    """
+    Recompute every rollup from the live and archived comments.
+
+    Comments changed while this runs may be miscounted on databases that
+    don't serialise it against other writers, so prefer a quiet moment.
+    """
+    with transaction.atomic():
+        deltas = defaultdict(lambda: [0, 0, 0])
+        for model in (Comment, ArchivedComment):
+            rows = (
+                model.objects.order_by()
+                .values("post_id", date=TruncDate("created_at"))
+                .annotate(
+                    total=Count("id"),
+                    flagged=Count("id", filter=Q(flagged=True)),
+                    overridden=Count("id", filter=Q(overridden=True)),
+                )
+            )
+            for row in rows:
+                counts = deltas[row["post_id"], row["date"]]
+                counts[0] += row["total"]
+                counts[1] += row["flagged"]
+                counts[2] += row["overridden"]
+
+        DailyCommentStats.objects.all().delete()
+        DailyCommentStats.objects.bulk_create(
+            DailyCommentStats(
+                post_id=post_id,
+                date=date,
+                total=total,
+                flagged=flagged,
+                overridden=overridden,
+            )
+            for (post_id, date), (total, flagged, overridden) in deltas.items()
+        )
+    return len(deltas)
@@ -1,10 +1,52 @@
 # Create your tests here.
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.utils import timezone
+from prometheus_client import REGISTRY
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from .classification import classify_comment
-from .models import Comment, Post
+from smart_comments.db.replicas import (
+    PrimaryStickinessMiddleware,
+    ReplicaRouter,
+    use_primary,
+)
+from smart_comments.metrics import _in_flight, reason_label
+
+from . import spam_model, stats
+from .artifacts import ModelArtifact, write_artifact
+from .classification import (
+    ClassificationService,
+    MLClassificationService,
+    classify_comment,
+)
+from .models import ArchivedComment, Comment, DailyCommentStats, Post
+from .patterns import backtracking_risks
+from .profiling import RuleProfiler
+from . import similarity as similarity_module
+from .similarity import (
+    NearDuplicateIndex,
+    SignatureLog,
+    minhash,
+    recent_flagged_comments,
+    similarity,
+)
+from .throttling import CommentAuthorRateThrottle, CommentIPRateThrottle
 
 
 class ClassificationTestCase(TestCase):
@@ -166,3 +208,1047 @@ class CommentAPITestCase(APITestCase):
         # Should only return flagged comments
         flagged_count = len([c for c in response.data if c.get("flagged", False)])
         self.assertGreater(flagged_count, 0)
+
+
+class TunedSQLiteBackendTestCase(TestCase):
+    """Tests for the opt-in high-throughput SQLite profile"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        connections.settings["tuned"] = connections.configure_settings(
+            {
+                "default": {
+                    "ENGINE": "smart_comments.db.sqlite3",
+                    "NAME": str(Path(tmp.name) / "tuned.sqlite3"),
+                    "OPTIONS": {"busy_timeout": 1234},
+                }
+            }
+        )["default"]
+        self.addCleanup(connections.settings.pop, "tuned")
+        self.addCleanup(connections.__delitem__, "tuned")
+        self.addCleanup(lambda: connections["tuned"].close())
+
+    def pragma(self, name):
+        with connections["tuned"].cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        """Test that new connections get WAL, NORMAL sync and the busy timeout"""
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("busy_timeout"), 1234)
+
+    def test_atomic_takes_write_lock_immediately(self):
+        """Test that atomic blocks start with BEGIN IMMEDIATE"""
+        conn = connections["tuned"]
+        with self.settings(DEBUG=True), transaction.atomic(using="tuned"):
+            conn.cursor().execute("SELECT 1")
+            self.assertIn("BEGIN IMMEDIATE", [q["sql"] for q in conn.queries])
+
+
+class ReplicaRouterTestCase(TransactionTestCase):
+    """Tests for read-replica routing"""
+
+    def setUp(self):
+        self.router = ReplicaRouter(replicas=["replica_0", "replica_1"])
+
+    def test_reads_round_robin_over_replicas(self):
+        """Test that blog reads alternate between replicas"""
+        aliases = [self.router.db_for_read(Comment) for _ in range(4)]
+        self.assertEqual(aliases, ["replica_0", "replica_1"] * 2)
+
+    def test_writes_go_to_primary(self):
+        """Test that writes always use the primary"""
+        self.assertEqual(self.router.db_for_write(Comment), "default")
+
+    def test_reads_pinned_to_primary(self):
+        """Test that pinned reads and reads inside transactions use the primary"""
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_other_apps_not_routed(self):
+        """Test that non-blog models are left to the default database"""
+        from django.contrib.auth.models import User
+
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_no_replicas_configured(self):
+        """Test that the router stays out of the way without replicas"""
+        self.assertIsNone(ReplicaRouter(replicas=[]).db_for_read(Post))
+
+    def test_sticky_window_after_write(self):
+        """Test that a client reads from the primary right after writing"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Comment))
+            return HttpResponse(status=201 if request.method == "POST" else 200)
+
+        middleware = PrimaryStickinessMiddleware(view)
+        factory = RequestFactory()
+        middleware(factory.get("/api/comments/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.post("/api/comments/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.get("/api/comments/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.get("/api/comments/", REMOTE_ADDR="10.0.0.2"))
+        self.assertNotEqual(seen[0], "default")
+        self.assertEqual(seen[1:3], ["default", "default"])
+        self.assertNotEqual(seen[3], "default")
+
+    def test_queries_counted_per_alias(self):
+        """Test that executed queries are exported per database alias"""
+
+        def count():
+            return REGISTRY.get_sample_value("db_queries_total", {"alias": "default"})
+
+        list(Post.objects.using("default"))
+        before = count()
+        list(Post.objects.using("default"))
+        self.assertEqual(count(), before + 1)
+
+    def test_least_loaded_avoids_busy_replica(self):
+        """Test that least_loaded skips replicas with queries in flight"""
+        router = ReplicaRouter(["replica_0", "replica_1"], "least_loaded")
+        self.assertEqual(
+            [router._pick_replica() for _ in range(4)],
+            ["replica_0", "replica_1", "replica_0", "replica_1"],
+        )
+        busy = _in_flight.setdefault("replica_0", deque())
+        busy.append(None)
+        try:
+            self.assertEqual(
+                [router._pick_replica() for _ in range(2)], ["replica_1", "replica_1"]
+            )
+        finally:
+            busy.pop()
+
+
+class CommentThrottleTestCase(APITestCase):
+    """Tests for comment submission rate limiting"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.post = Post.objects.create(title="Test Post", body="Test body")
+
+    def submit(self, author, ip="10.0.0.1"):
+        data = {"post": self.post.id, "author": author, "text": "A normal comment."}
+        return self.client.post("/api/comments/", data, format="json", REMOTE_ADDR=ip)
+
+    @mock.patch.object(CommentAuthorRateThrottle, "rate", "2/min", create=True)
+    def test_author_limited_across_ips(self):
+        """Test that an author is throttled whichever IP they post from"""
+        self.assertEqual(self.submit("Flooder", "10.0.0.1").status_code, 201)
+        self.assertEqual(self.submit("flooder ", "10.0.0.2").status_code, 201)
+        response = self.submit("Flooder", "10.0.0.3")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.submit("Someone Else", "10.0.0.3").status_code, 201)
+
+    @mock.patch.object(CommentIPRateThrottle, "rate", "2/min", create=True)
+    def test_ip_limited_across_authors(self):
+        """Test that one IP is throttled whatever author names it uses"""
+        self.assertEqual(self.submit("A").status_code, 201)
+        self.assertEqual(self.submit("B").status_code, 201)
+        self.assertEqual(self.submit("C").status_code, 429)
+        self.assertEqual(self.submit("C", "10.0.0.2").status_code, 201)
+
+    @mock.patch.object(CommentIPRateThrottle, "rate", "1/min", create=True)
+    def test_rejection_skips_database(self):
+        """Test that throttled submissions never query the database"""
+        self.submit("A")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.submit("B").status_code, 429)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    @mock.patch.object(CommentIPRateThrottle, "rate", "4/min", create=True)
+    def test_sliding_window_weights_previous_window(self):
+        """Test that the previous window still counts while it overlaps"""
+        with mock.patch.object(CommentIPRateThrottle, "timer", return_value=60.0):
+            for _ in range(4):
+                self.assertEqual(self.submit("A").status_code, 201)
+        # Halfway into the next window, half of the previous 4 still count.
+        with mock.patch.object(CommentIPRateThrottle, "timer", return_value=150.0):
+            self.assertEqual(self.submit("A").status_code, 201)
+            self.assertEqual(self.submit("A").status_code, 201)
+            self.assertEqual(self.submit("A").status_code, 429)
+
+
+class NearDuplicateTestCase(TestCase):
+    """Tests for near-duplicate spam detection"""
+
+    SPAM = "Buy now and get the best discount pills with fast delivery worldwide today"
+    VARIANT = (
+        "Purchase and get the best discount pills with fast delivery worldwide today"
+    )
+
+    def test_similarity_estimate(self):
+        """Test that signatures of near-copies agree far more than unrelated ones"""
+        self.assertEqual(similarity(minhash(self.SPAM), minhash(self.SPAM)), 1.0)
+        self.assertGreater(similarity(minhash(self.SPAM), minhash(self.VARIANT)), 0.6)
+        unrelated = minhash("I really enjoyed reading this post, thanks for sharing it")
+        self.assertLess(similarity(minhash(self.SPAM), unrelated), 0.2)
+
+    def test_short_text_not_fingerprinted(self):
+        """Test that texts too short to compare are skipped"""
+        self.assertIsNone(minhash("nice post"))
+
+    def test_variant_of_known_spam_flagged(self):
+        """Test that a reworded copy of indexed spam is flagged"""
+        index = NearDuplicateIndex()
+        service = ClassificationService(near_duplicates=index)
+        self.assertFalse(service.classify_comment(self.VARIANT)["flagged"])
+        index.add(minhash(self.SPAM))
+        result = service.classify_comment(self.VARIANT)
+        self.assertTrue(result["flagged"])
+        self.assertIn("Near-duplicate", result["reasons"][0])
+        index.discard(minhash(self.SPAM))
+        self.assertFalse(service.classify_comment(self.VARIANT)["flagged"])
+
+    def test_index_bounded(self):
+        """Test that the oldest signatures are evicted at capacity"""
+        index = NearDuplicateIndex(capacity=2)
+        first = minhash(self.SPAM)
+        index.add(first)
+        index.add(minhash("one two three four five six seven"))
+        index.add(minhash("eight nine ten eleven twelve thirteen"))
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.best_match(first))
+
+    def test_background_load_off_lookup_path(self):
+        """Test that a background first fill doesn't hold up lookups"""
+        release = threading.Event()
+
+        def slow_loader(since_id, limit):
+            release.wait(5)
+            return [(1, self.SPAM)]
+
+        index = NearDuplicateIndex(loader=slow_loader, background=True)
+        start = time.perf_counter()
+        self.assertIsNone(index.best_match(minhash(self.VARIANT)))
+        self.assertLess(time.perf_counter() - start, 1.0)
+        release.set()
+        index._loading.join()
+        self.assertIsNotNone(index.best_match(minhash(self.VARIANT)))
+
+    def test_index_loads_flagged_comments(self):
+        """Test that the index is rebuilt from flagged comments in the database"""
+        post = Post.objects.create(title="Test Post", body="Test body")
+        Comment.objects.create(
+            post=post, author="Spammer", text=self.SPAM, flagged=True
+        )
+        Comment.objects.create(post=post, author="Reader", text=self.VARIANT)
+        index = NearDuplicateIndex(loader=recent_flagged_comments)
+        self.assertIsNotNone(index.best_match(minhash(self.VARIANT)))
+        self.assertEqual(len(index), 1)
+
+    def test_moderator_changes_reach_other_processes(self):
+        """Test that clearing or re-flagging spam in one index reaches the others"""
+        cache.clear()
+        post = Post.objects.create(title="Test Post", body="Test body")
+        Comment.objects.create(
+            post=post, author="Spammer", text=self.SPAM, flagged=True
+        )
+        workers = [
+            NearDuplicateIndex(loader=recent_flagged_comments, log=SignatureLog())
+            for _ in range(2)
+        ]
+        for index in workers:
+            index.refresh(force=True)
+
+        workers[0].discard(minhash(self.SPAM), share=True)
+        workers[1].refresh(force=True)
+        self.assertIsNone(workers[1].best_match(minhash(self.VARIANT)))
+
+        workers[0].add(minhash(self.SPAM), share=True)
+        workers[1].refresh(force=True)
+        self.assertIsNotNone(workers[1].best_match(minhash(self.VARIANT)))
+
+    def test_missing_log_entry_skipped_after_one_refresh(self):
+        """Test that an expired log entry doesn't stall the changes after it"""
+        cache.clear()
+        log = SignatureLog()
+        index = NearDuplicateIndex(log=log)
+        index.refresh(force=True)
+        index.add(minhash(self.SPAM))
+        log.append("add", minhash("one two three four five six seven"))
+        log.append("discard", minhash(self.SPAM))
+        cache.delete(f"{log.prefix}:1")
+
+        index.refresh(force=True)
+        self.assertIsNotNone(index.best_match(minhash(self.SPAM)))
+        index.refresh(force=True)
+        self.assertIsNone(index.best_match(minhash(self.SPAM)))
+
+    def test_admin_edit_form_updates_index(self):
+        """Test that un-flagging in the admin edit form forgets the comment"""
+        from django.contrib.auth.models import User
+
+        admin_user = User.objects.create_superuser("admin", "a@example.com", "pw")
+        self.client.force_login(admin_user)
+        post = Post.objects.create(title="Test Post", body="Test body")
+        comment = Comment.objects.create(
+            post=post, author="Spammer", text=self.SPAM, flagged=True
+        )
+        with mock.patch("blog.admin.forget_flagged") as forget:
+            response = self.client.post(
+                f"/admin/blog/comment/{comment.id}/change/",
+                {
+                    "post": post.id,
+                    "author": "Spammer",
+                    "text": self.SPAM,
+                    # Read-only: only a flag change sets it
+                    "overridden": "on",
+                    "created_at_0": comment.created_at.strftime("%Y-%m-%d"),
+                    "created_at_1": comment.created_at.strftime("%H:%M:%S"),
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        forget.assert_called_once_with(self.SPAM)
+        comment.refresh_from_db()
+        self.assertFalse(comment.flagged)
+        self.assertTrue(comment.overridden)
+
+    def test_variant_flagged_via_api(self):
+        """Test that a reworded copy of a just-flagged comment is flagged"""
+        post = Post.objects.create(title="Test Post", body="Test body")
+        data = {"post": post.id, "author": "Spammer", "text": self.SPAM}
+        response = self.client.post(
+            "/api/comments/", data, content_type="application/json"
+        )
+        self.assertTrue(response.json()["flagged"])
+        data = {"post": post.id, "author": "Spammer2", "text": self.VARIANT}
+        response = self.client.post(
+            "/api/comments/", data, content_type="application/json"
+        )
+        self.assertTrue(response.json()["flagged"])
+
+    def test_oversized_comment_fingerprint_bounded(self):
+        """Test that a huge flagged comment is fingerprinted from its start only"""
+        post = Post.objects.create(title="Test Post", body="Test body")
+        text = "lorem ipsum dolor sit amet " * 80_000
+        with mock.patch(
+            "blog.similarity._hash64", wraps=similarity_module._hash64
+        ) as h:
+            response = self.client.post(
+                "/api/comments/",
+                {"post": post.id, "author": "Spammer", "text": text},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.json()["flagged"])
+        self.assertLess(h.call_count, 200)
+
+
+class MetricsTestCase(APITestCase):
+    """Tests for the health check and Prometheus metrics endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(title="Test Post", body="Test body")
+
+    def test_health(self):
+        """Test that the health check responds"""
+        response = self.client.get("/health/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_metrics_exposed(self):
+        """Test that request, DB and classifier series are exported"""
+        data = {"post": self.post.id, "author": "Spammer", "text": "spam spam spam"}
+        self.client.post("/api/comments/", data, format="json")
+        self.client.get("/api/comments/flagged/")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{action="create",'
+            'status="201",view="CommentViewSet"}',
+            body,
+        )
+        self.assertIn('action="flagged"', body)
+        self.assertIn("db_queries_per_request_count", body)
+        self.assertIn("classify_comment_duration_seconds_count", body)
+        self.assertIn('classify_comment_total{classification="needs_review"}', body)
+        self.assertIn('classify_comment_reason_total{reason="Contains keywords"}', body)
+
+
+class RuleProfilerTestCase(TestCase):
+    """Tests for per-rule classifier profiling"""
+
+    def test_rules_timed_and_hits_counted(self):
+        """Test that every rule is recorded with its hits when sampled"""
+        profiler = RuleProfiler(sample_rate=1.0)
+        service = ClassificationService(profiler=profiler)
+        service.classify_comment("This is spam and stupid")
+        stats = {rule.rule: rule for rule in profiler.report()}
+        self.assertEqual(stats["keyword: spam"].hits, 1)
+        self.assertEqual(stats["keyword: scam"].hits, 0)
+        self.assertEqual(stats["keyword: scam"].calls, 1)
+        self.assertIn("punctuation", stats)
+        self.assertIn("length", stats)
+        self.assertGreater(sum(rule.seconds for rule in stats.values()), 0)
+
+    def test_unsampled_calls_not_recorded(self):
+        """Test that calls outside the sample are not profiled"""
+        profiler = RuleProfiler(sample_rate=0)
+        result = ClassificationService(profiler=profiler).classify_comment("spam!")
+        self.assertTrue(result["flagged"])
+        self.assertEqual(profiler.report(), [])
+
+    def test_classifier_profile_command(self):
+        """Test that the replay command ranks rules"""
+        post = Post.objects.create(title="Test Post", body="Test body")
+        Comment.objects.create(post=post, author="Spammer", text="spam spam spam")
+        Comment.objects.create(post=post, author="Reader", text="Lovely post, thanks")
+        out = StringIO()
+        call_command("classifier_profile", stdout=out)
+        self.assertIn("Slowest rules", out.getvalue())
+        self.assertIn("keyword: spam", out.getvalue())
+
+    def test_classifier_profile_ignores_self_matches(self):
+        """Test that replayed flagged comments don't match their own signature"""
+        post = Post.objects.create(title="Test Post", body="Test body")
+        for text in [
+            "cheap watches for sale visit our shop today",
+            "win a free cruise by replying with your bank details",
+            "hot singles in your area are waiting to meet you",
+        ]:
+            Comment.objects.create(post=post, author="s", text=text, flagged=True)
+        out = StringIO()
+        call_command("classifier_profile", stdout=out)
+        hits = out.getvalue().split("Most frequently hit rules:")[1]
+        self.assertNotIn("near_duplicate", hits)
+
+
+class SpamPatternSafetyTestCase(TestCase):
+    """Tests for ReDoS-safe spam pattern matching"""
+
+    ADVERSARIAL_INPUTS = [
+        "http://" * 200_000,
+        "http://" + "a" * 1_000_000,
+        "A" * 1_000_000 + "a",
+        "ab" * 500_000,
+        "http://x.xy" * 100_000,
+    ]
+
+    def test_unsafe_shapes_detected(self):
+        """Test that catastrophic-backtracking shapes are recognised"""
+        self.assertTrue(backtracking_risks(r"(a+)+$"))
+        self.assertTrue(backtracking_risks(r"(a|ab)*c"))
+        self.assertTrue(backtracking_risks(r"https?://.*\.xyz"))
+        self.assertEqual(
+            backtracking_risks(r"(?m)^(?>[^\n]*?https?://)[^\n]*\.xyz"), []
+        )
+        self.assertEqual(backtracking_risks(r"(?:a++)+"), [])
+
+    def test_unsafe_pattern_rejected_at_load(self):
+        """Test that a classifier with an unsafe pattern cannot be created"""
+
+        class UnsafeService(ClassificationService):
+            SPAM_PATTERNS = [r"(\w+\s?)+$"]
+
+        with self.assertRaises(ImproperlyConfigured):
+            UnsafeService()
+
+    def test_shipped_patterns_still_match(self):
+        """Test that the hardened patterns flag what they are meant to"""
+        service = ClassificationService()
+        for text in [
+            "Visit https://definitely-not-a-scam.xyz today",
+            "Check http://bit.ly/abc please",
+            "This is AMAZING news",
+            "See http://example.com/offer and grab it at deals.xyz",
+        ]:
+            self.assertTrue(service.classify_comment(text)["flagged"], text)
+
+    def test_hardening_keeps_verdicts(self):
+        """Test that comments the original patterns let through still pass"""
+        service = ClassificationService()
+        for text in [
+            "Our site hit 100000 visitors",
+            "Great post.     Thanks",
+            "Wowwwww",
+            "-----",
+            "Read more at example.xyz",
+            "Docs at https://example.com\nand notes.xyz",
+        ]:
+            self.assertFalse(service.classify_comment(text)["flagged"], text)
+            self.assertFalse(service.is_flagged(text), text)
+
+    def test_adversarial_inputs_bounded(self):
+        """Test that worst-case inputs classify in bounded time"""
+        service = ClassificationService(near_duplicates=NearDuplicateIndex())
+        for text in self.ADVERSARIAL_INPUTS:
+            start = time.perf_counter()
+            result = service.classify_comment(text)
+            self.assertTrue(service.is_flagged(text))
+            service.near_duplicates.add(minhash(text))
+            self.assertLess(time.perf_counter() - start, 1.0)
+            self.assertTrue(result["flagged"])
+
+    def test_time_budget_sends_to_review(self):
+        """Test that running out of pattern time flags the comment"""
+
+        class NoBudgetService(ClassificationService):
+            PATTERN_TIME_BUDGET = -1
+
+        result = NoBudgetService().classify_comment("A perfectly normal comment.")
+        self.assertTrue(result["flagged"])
+        self.assertIn("Spam pattern checks timed out", result["reasons"])
+
+
+class FastVerdictTestCase(TestCase):
+    """Tests for the short-circuiting fast-verdict mode"""
+
+    TEXTS = [
+        "This is a great article! Very informative.",
+        "CLICK HERE http://bit.ly/spam for deals!",
+        "This is spam and stupid",
+        "AMAZING DEALS HERE NOW!!!",
+        "ok",
+        "   ",
+        "!!!...???",
+        "Sooooooo good",
+        "Visit https://definitely-not-a-scam.xyz today",
+        "x" * 1001,
+        " " * 1000,
+        "I really enjoyed reading this post. Thank you for sharing!",
+    ]
+
+    def test_same_verdict_as_explain_mode(self):
+        """Test that the fast verdict always agrees with the full classification"""
+        service = ClassificationService()
+        for text in self.TEXTS:
+            self.assertEqual(
+                service.is_flagged(text),
+                service.classify_comment(text)["flagged"],
+                repr(text[:40]),
+            )
+
+    def test_reason_matches_explain_mode(self):
+        """Test that the deciding reason is of a kind classify_comment reports"""
+        service = ClassificationService()
+        for text in self.TEXTS:
+            reason = service.flag_reason(text)
+            if reason is not None:
+                reasons = service.classify_comment(text)["reasons"]
+                self.assertIn(reason_label(reason), map(reason_label, reasons))
+
+    def test_stops_at_first_positive(self):
+        """Test that later checks are skipped once one fires"""
+        profiler = RuleProfiler(sample_rate=1.0)
+        service = ClassificationService(profiler=profiler)
+        self.assertTrue(service.is_flagged("This is spam and more"))
+        rules = {rule.rule for rule in profiler.report()}
+        self.assertIn("keyword: spam", rules)
+        self.assertNotIn("keyword: scam", rules)
+        self.assertNotIn("punctuation", rules)
+
+
+class ClassifierWarmUpTestCase(TestCase):
+    """Tests for the shared, preloadable classifier"""
+
+    def setUp(self):
+        patcher = mock.patch("blog.classification._classifier", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_built_once_on_first_use(self):
+        """Test that every caller gets the same classifier"""
+        from . import classification
+
+        self.assertIsNone(classification._classifier)
+        self.assertIs(classification.get_classifier(), classification.get_classifier())
+
+    def test_warm_up_loads_near_duplicate_index(self):
+        """Test that warming up loads known spam before the first request"""
+        post = Post.objects.create(title="Post", body="Body")
+        Comment.objects.create(
+            post=post,
+            author="spammer",
+            text="cheap watches for sale visit our shop today",
+            flagged=True,
+        )
+        from . import classification
+
+        classifier = classification.warm_up()
+        self.assertEqual(len(classifier.near_duplicates), 1)
+        with self.assertNumQueries(0):
+            classification.is_flagged("cheap watches for sale visit our shop now")
+
+
+class ModelArtifactTestCase(TestCase):
+    """Tests for memory-mapped model artifacts and the spam model"""
+
+    SPAM = [
+        "win free bitcoin now visit my profile",
+        "free bitcoin giveaway visit my profile today",
+        "cheap followers free bitcoin visit my profile",
+    ]
+    HAM = [
+        "great explanation of django middleware thanks",
+        "i prefer fastapi for small services but django here makes sense",
+        "thanks for the interview tips they helped a lot",
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = str(Path(self.tmpdir.name) / "model.bin")
+
+    def train(self, version, samples=None):
+        if samples is None:
+            samples = [(text, True) for text in self.SPAM] + [
+                (text, False) for text in self.HAM
+            ]
+        weights, bias = spam_model.train(samples, n_features=1024)
+        spam_model.save(self.path, weights, bias, version, threshold=0.5)
+
+    def test_round_trip_zero_copy(self):
+        """Test that arrays come back aligned, read-only and unchanged"""
+        values = array("f", [0.5, -1.25, 3.0])
+        write_artifact(
+            self.path, {"ids": array("q", [1, 2]), "w": values}, {"version": "1"}
+        )
+        artifact = ModelArtifact(self.path)
+        self.assertEqual(artifact.version, "1")
+        self.assertEqual(artifact["w"].tolist(), values.tolist())
+        self.assertEqual(artifact["ids"].tolist(), [1, 2])
+        self.assertTrue(artifact["w"].readonly)
+        with self.assertRaises(TypeError):
+            artifact["w"][0] = 1.0
+
+    def test_rejects_other_files(self):
+        """Test that a file without the artifact header is refused"""
+        Path(self.path).write_bytes(b"not a model at all")
+        with self.assertRaises(ValueError):
+            ModelArtifact(self.path)
+
+    def test_model_scores_spam_higher(self):
+        """Test that the trained model separates spam from normal comments"""
+        self.train("1")
+        model = spam_model.HashedLinearModel(ModelArtifact(self.path))
+        self.assertGreater(model.score("free bitcoin visit my profile"), 0.5)
+        self.assertLess(model.score("thanks for the django tips"), 0.5)
+
+    def test_hot_swap_on_rename(self):
+        """Test that a published new version is picked up without a restart"""
+        self.train("1")
+        service = MLClassificationService(artifact_path=self.path)
+        service.artifacts.check_seconds = 0
+        old = service.model
+        self.assertEqual(old.version, "1")
+        self.assertTrue(service.is_flagged("free bitcoin visit my profile"))
+
+        self.train("2", samples=[(text, False) for text in self.SPAM + self.HAM])
+        self.assertEqual(service.model.version, "2")
+        self.assertFalse(service.is_flagged("free bitcoin visit my profile"))
+        # The previous mapping stays usable for callers still holding it.
+        self.assertGreater(old.score("free bitcoin visit my profile"), 0.5)
+
+    def test_bad_update_keeps_current_model(self):
+        """Test that a broken file doesn't take the loaded model away"""
+        self.train("1")
+        service = MLClassificationService(artifact_path=self.path)
+        service.artifacts.check_seconds = 0
+        self.assertEqual(service.model.version, "1")
+        Path(self.path).unlink()
+        Path(self.path).write_bytes(b"garbage")
+        with self.assertLogs("blog.artifacts", "ERROR"):
+            self.assertEqual(service.model.version, "1")
+
+    def test_classification_reports_model_score(self):
+        """Test that model verdicts are explained like rule verdicts"""
+        self.train("1")
+        result = MLClassificationService(artifact_path=self.path).classify_comment(
+            "free bitcoin visit my profile"
+        )
+        self.assertTrue(result["flagged"])
+        self.assertEqual(result["model_version"], "1")
+        # Bounded metric label, whatever the score
+        self.assertIn("Spam model score", map(reason_label, result["reasons"]))
+
+    def test_train_spam_model_command(self):
+        """Test that the command trains on stored comments and publishes"""
+        post = Post.objects.create(title="Post", body="Body")
+        for text in self.SPAM:
+            Comment.objects.create(post=post, author="a", text=text, flagged=True)
+        for text in self.HAM:
+            Comment.objects.create(post=post, author="b", text=text)
+        out = StringIO()
+        call_command(
+            "train_spam_model",
+            output=self.path,
+            features=1024,
+            model_version="v7",
+            stdout=out,
+        )
+        self.assertIn("Published model v7", out.getvalue())
+        self.assertEqual(ModelArtifact(self.path).metadata["n_features"], 1024)
+
+
+class ArchiveCommentsTestCase(APITestCase):
+    """Tests for moving old comments into the archive"""
+
+    def setUp(self):
+        self.post = Post.objects.create(title="Post", body="Body")
+        old = timezone.now() - timedelta(days=400)
+        self.old = [
+            Comment.objects.create(
+                post=self.post, author="a", text=f"old {i}", created_at=old
+            )
+            for i in range(5)
+        ]
+        self.old_flagged = Comment.objects.create(
+            post=self.post, author="b", text="old spam", flagged=True, created_at=old
+        )
+        self.recent = Comment.objects.create(post=self.post, author="c", text="new")
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command("archive_comments", *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_old_comments_in_batches(self):
+        """Test that old comments move to the archive, keeping their ids"""
+        output = self.archive("--older-than", "365", "--batch-size", "2")
+        self.assertIn("Archived 6 comment(s)", output)
+        self.assertEqual(list(Comment.objects.all()), [self.recent])
+        self.assertEqual(
+            set(ArchivedComment.objects.values_list("id", flat=True)),
+            {c.id for c in self.old + [self.old_flagged]},
+        )
+
+    def test_counters_unchanged(self):
+        """Test that post totals still include archived comments"""
+        self.archive("--older-than", "365")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.archived_comment_count, 6)
+        self.assertEqual(self.post.archived_flagged_count, 1)
+
+        response = self.client.get(f"/api/posts/{self.post.id}/")
+        self.assertEqual(response.data["comment_count"], 7)
+        self.assertEqual(response.data["flagged_comment_count"], 1)
+        self.assertEqual(len(response.data["comments"]), 1)
+
+    def test_flagged_queue(self):
+        """Test that archived comments leave the review queue unless kept"""
+        self.archive("--older-than", "365", "--keep-flagged")
+        self.assertTrue(Comment.objects.filter(id=self.old_flagged.id).exists())
+        self.archive("--older-than", "365")
+        response = self.client.get("/api/comments/flagged/")
+        self.assertEqual(response.data, [])
+
+    def test_dry_run(self):
+        """Test that a dry run moves nothing"""
+        self.assertIn("6 comment(s)", self.archive("--older-than", "365", "--dry-run"))
+        self.assertEqual(Comment.objects.count(), 7)
+        self.assertFalse(ArchivedComment.objects.exists())
+
+    def test_archive_api(self):
+        """Test that archived comments are readable, filterable and read-only"""
+        self.archive("--older-than", "365")
+        response = self.client.get(
+            "/api/archived-comments/", {"post": self.post.id, "flagged": "true"}
+        )
+        self.assertEqual(
+            [c["id"] for c in response.data["results"]], [self.old_flagged.id]
+        )
+        response = self.client.delete(f"/api/archived-comments/{self.old_flagged.id}/")
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_archive_admin_cannot_delete(self):
+        """Test that archived comments can't be deleted in the admin"""
+        from django.contrib.auth.models import User
+
+        self.archive("--older-than", "365")
+        self.client.force_login(
+            User.objects.create_superuser("admin", "a@example.com", "pw")
+        )
+        response = self.client.post(
+            f"/admin/blog/archivedcomment/{self.old_flagged.id}/delete/",
+            {"post": "yes"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(ArchivedComment.objects.filter(id=self.old_flagged.id).exists())
+
+
+class CommentStatsTestCase(APITestCase):
+    """Tests for the daily moderation rollups and /api/stats/"""
+
+    def setUp(self):
+        self.post = Post.objects.create(title="Post", body="Body")
+        self.other = Post.objects.create(title="Other", body="Body")
+
+    def comment(self, text, post=None):
+        response = self.client.post(
+            "/api/comments/",
+            {"post": (post or self.post).id, "author": "a", "text": text},
+            format="json",
+        )
+        return Comment.objects.get(id=response.data["id"])
+
+    def rollups(self):
+        return list(
+            DailyCommentStats.objects.order_by("post_id", "date").values_list(
+                "post", "total", "flagged", "overridden"
+            )
+        )
+
+    def test_maintained_incrementally(self):
+        """Test that creates, overrides and deletes keep rollups equal to a rebuild"""
+        self.comment("A thoughtful comment about the article")
+        spam = self.comment("CLICK HERE http://bit.ly/spam for deals!")
+        safe = self.comment("Another perfectly reasonable reply here", self.other)
+        stats.set_flagged(Comment.objects.filter(id=spam.id), False)
+        stats.set_flagged(Comment.objects.filter(id=safe.id), True)
+        stats.set_flagged(Comment.objects.filter(id=safe.id), True)  # no change
+        self.comment("One more ordinary comment on the post")
+        self.client.delete(f"/api/comments/{Comment.objects.last().id}/")
+
+        self.assertEqual(
+            self.rollups(), [(self.post.id, 2, 0, 1), (self.other.id, 1, 1, 1)]
+        )
+        incremental = self.rollups()
+        stats.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_second_override_restores_verdict(self):
+        """Test that reversing an override doesn't count as another one"""
+        spam = self.comment("CLICK HERE http://bit.ly/spam for deals!")
+        stats.set_flagged(Comment.objects.filter(id=spam.id), False)
+        stats.set_flagged(Comment.objects.filter(id=spam.id), True)
+        spam.refresh_from_db()
+        self.assertFalse(spam.overridden)
+        self.assertEqual(self.rollups(), [(self.post.id, 1, 1, 0)])
+
+    def test_archiving_keeps_counts(self):
+        """Test that archived comments still count after a rebuild"""
+        old = timezone.now() - timedelta(days=400)
+        Comment.objects.create(post=self.post, author="a", text="old", created_at=old)
+        call_command("archive_comments", "--older-than", "365", stdout=StringIO())
+        call_command("rebuild_comment_stats", stdout=StringIO())
+        self.assertEqual(self.rollups(), [(self.post.id, 1, 0, 0)])
+
+    def test_seed_data_counted(self):
+        """Test that seeded comments are in the rollups"""
+        call_command("seed_data", stdout=StringIO())
+        seeded = self.rollups()
+        self.assertEqual(sum(row[1] for row in seeded), Comment.objects.count())
+        stats.rebuild()
+        self.assertEqual(self.rollups(), seeded)
+
+    def test_stats_endpoint(self):
+        """Test that the endpoint serves totals, daily and per-post series"""
+        self.comment("A thoughtful comment about the article")
+        self.comment("CLICK HERE http://bit.ly/spam for deals!")
+        self.comment("Another perfectly reasonable reply here", self.other)
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/stats/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["totals"]["total"], 3)
+        self.assertEqual(response.data["totals"]["flagged"], 1)
+        self.assertAlmostEqual(response.data["totals"]["flag_rate"], 1 / 3)
+        self.assertEqual(len(response.data["daily"]), 1)
+        self.assertEqual(
+            [(p["title"], p["total"]) for p in response.data["posts"]],
+            [("Post", 2), ("Other", 1)],
+        )
+
+        response = self.client.get("/api/stats/", {"post": self.other.id})
+        self.assertEqual(response.data["totals"]["total"], 1)
+
+    def test_stats_endpoint_validates_range(self):
+        """Test that an inverted date range is rejected"""
+        response = self.client.get(
+            "/api/stats/", {"start": "2026-02-01", "end": "2026-01-01"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportCommentsTestCase(TestCase):
+    """Tests for the streaming comment import"""
+
+    def setUp(self):
+        self.post = Post.objects.create(title="First post", body="Body")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.tmpdir.name) / name
+        path.write_text(content)
+        return str(path)
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command("import_comments", path, "--workers", "0", *args, stdout=out)
+        return out.getvalue()
+
+    def jsonl(self, *records):
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def test_jsonl_by_id_and_title(self):
+        """Test that posts are matched by id or title and comments classified"""
+        path = self.write(
+            "comments.jsonl",
+            self.jsonl(
+                {"post": self.post.id, "author": "a", "text": "Nice write-up, thanks"},
+                {
+                    "post_title": "First post",
+                    "author": "b",
+                    "text": "CLICK HERE http://bit.ly/x",
+                    "created_at": "2020-05-01T12:00:00Z",
+                },
+            ),
+        )
+        output = self.run_import(path)
+        self.assertIn("Imported 2 comment(s), rejected 0", output)
+        safe, spam = Comment.objects.order_by("author")
+        self.assertFalse(safe.flagged)
+        self.assertTrue(spam.flagged)
+        self.assertEqual(spam.created_at.isoformat(), "2020-05-01T12:00:00+00:00")
+        self.assertEqual(
+            DailyCommentStats.objects.get(date=spam.created_at.date()).flagged, 1
+        )
+        imported = list(DailyCommentStats.objects.values_list("date", "total"))
+        stats.rebuild()
+        self.assertCountEqual(
+            DailyCommentStats.objects.values_list("date", "total"), imported
+        )
+
+    def test_copy_rows_escaped(self):
+        """Test that rows for Postgres COPY escape its special characters"""
+        from blog.management.commands.import_comments import _copy_line
+
+        line = _copy_line((1, "a\tb", "x\\y\nz\r", "2020-05-01T12:00:00+00:00", 1, 0))
+        self.assertEqual(
+            line, "1\ta\\tb\tx\\\\y\\nz\\r\t2020-05-01T12:00:00+00:00\tt\tf\n"
+        )
+
+    def test_csv_with_multiline_field(self):
+        """Test that CSV records may span lines inside quoted fields"""
+        path = self.write(
+            "comments.csv",
+            "post,author,text\n"
+            f'{self.post.id},a,"first line\nsecond line, with comma"\n'
+            f"{self.post.id},b,plain comment here\n",
+        )
+        self.run_import(path)
+        self.assertEqual(
+            list(Comment.objects.order_by("author").values_list("text", flat=True)),
+            ["first line\nsecond line, with comma", "plain comment here"],
+        )
+
+    def test_rejects_reported(self):
+        """Test that bad records are skipped and written out with the reason"""
+        path = self.write(
+            "comments.jsonl",
+            "not json\n"
+            + self.jsonl(
+                {"post": 999, "author": "a", "text": "unknown post"},
+                {"post_title": "Nope", "author": "a", "text": "unknown title"},
+                {"post": self.post.id, "author": "", "text": "no author"},
+                {"post": self.post.id, "author": "a", "text": "fine comment here"},
+            ),
+        )
+        rejects = str(Path(self.tmpdir.name) / "rejects.jsonl")
+        output = self.run_import(path, "--rejects", rejects)
+        self.assertIn("Imported 1 comment(s), rejected 4", output)
+        entries = [json.loads(line) for line in Path(rejects).read_text().splitlines()]
+        self.assertEqual(entries[0]["offset"], 0)
+        self.assertEqual(entries[0]["record"], "not json")
+        self.assertEqual(entries[1]["error"], "no post with id 999")
+
+    def test_resume_from_offset(self):
+        """Test that a resumed import continues after the committed records"""
+        content = self.jsonl(
+            *(
+                {"post": self.post.id, "author": f"user{i}", "text": f"comment {i}"}
+                for i in range(5)
+            )
+        )
+        path = self.write("comments.jsonl", content)
+        offset = len(content.splitlines(keepends=True)[0]) * 2
+        output = self.run_import(path, "--start-offset", str(offset))
+        self.assertIn(f"resume with --start-offset {len(content)}", output)
+        self.assertEqual(
+            list(Comment.objects.order_by("author").values_list("author", flat=True)),
+            ["user2", "user3", "user4"],
+        )
+
+    def test_resume_keeps_rejects_unique(self):
+        """Test that rejects are only written once their transaction commits"""
+        good = {"post": self.post.id, "author": "a", "text": "fine comment here"}
+        bad = {"post": 999, "author": "a", "text": "unknown post"}
+        path = self.write(
+            "comments.jsonl", self.jsonl(good, good, bad, good, good, bad)
+        )
+        rejects = str(Path(self.tmpdir.name) / "rejects.jsonl")
+        counts_added = stats.counts_added
+        calls = []
+
+        def interrupt_second(deltas):
+            calls.append(deltas)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return counts_added(deltas)
+
+        args = ["--rejects", rejects, "--chunk-size", "2", "--transaction-size", "2"]
+        with mock.patch.object(stats, "counts_added", interrupt_second):
+            output = self.run_import(path, *args)
+        self.assertIn("Interrupted.", output)
+        offset = output.rsplit("--start-offset ", 1)[1].rstrip(".\n")
+        self.run_import(path, *args, "--start-offset", offset)
+
+        self.assertEqual(Comment.objects.count(), 4)
+        entries = [json.loads(line) for line in Path(rejects).read_text().splitlines()]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(len({entry["offset"] for entry in entries}), 2)
+
+    def test_small_transactions(self):
+        """Test that imports commit in transaction-sized batches"""
+        path = self.write(
+            "comments.jsonl",
+            self.jsonl(
+                *(
+                    {"post": self.post.id, "author": "a", "text": f"comment {i}"}
+                    for i in range(7)
+                )
+            ),
+        )
+        sizes = []
+        counts_added = stats.counts_added
+
+        def record_size(deltas):
+            sizes.append(sum(total for total, _, _ in deltas.values()))
+            return counts_added(deltas)
+
+        with mock.patch.object(stats, "counts_added", record_size):
+            self.run_import(path, "--transaction-size", "3", "--chunk-size", "2")
+        # Transactions end on chunk boundaries once they reach 3 comments.
+        self.assertEqual(sizes, [4, 3])
+        self.assertEqual(Comment.objects.count(), 7)
+
+    def test_process_pool(self):
+        """Test that classification in worker processes gives the same verdicts"""
+        path = self.write(
+            "comments.jsonl",
+            self.jsonl(
+                {"post": self.post.id, "author": "a", "text": "Nice write-up, thanks"},
+                {"post": self.post.id, "author": "b", "text": "This is a scam"},
+            ),
+        )
+        out = StringIO()
+        call_command("import_comments", path, "--workers", "2", stdout=out)
+        self.assertEqual(
+            list(Comment.objects.order_by("author").values_list("flagged", flat=True)),
+            [False, True],
+        )
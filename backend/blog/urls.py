@@ -1,11 +1,20 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CommentViewSet, PostViewSet
+from .views import (
+    ArchivedCommentViewSet,
+    CommentViewSet,
+    PostViewSet,
+    StatsViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"posts", PostViewSet, basename="post")
 router.register(r"comments", CommentViewSet, basename="comment")
+router.register(
+    r"archived-comments", ArchivedCommentViewSet, basename="archived-comment"
+)
+router.register(r"stats", StatsViewSet, basename="stats")
 
 urlpatterns = [
     path("", include(router.urls)),
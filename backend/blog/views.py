@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Sum
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -6,8 +8,16 @@ from rest_framework import filters, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Comment, Post
-from .serializers import CommentSerializer, PostListSerializer, PostSerializer
+from . import stats
+from .models import ArchivedComment, Comment, DailyCommentStats, Post
+from .serializers import (
+    ArchivedCommentSerializer,
+    CommentSerializer,
+    PostListSerializer,
+    PostSerializer,
+    StatsQuerySerializer,
+)
+from .throttling import CommentAuthorRateThrottle, CommentIPRateThrottle
 
 
 class PostViewSet(viewsets.ModelViewSet):
@@ -59,6 +69,18 @@ class CommentViewSet(viewsets.ModelViewSet):
     ordering_fields = ["created_at"]
     ordering = ["created_at"]
 
+    def get_throttles(self):
+        """Rate limit new comments per IP and per author before classifying"""
+        if self.action == "create":
+            return [CommentIPRateThrottle(), CommentAuthorRateThrottle()]
+        return super().get_throttles()
+
+    def perform_destroy(self, instance):
+        """Delete the comment and stop counting it in the moderation stats"""
+        with transaction.atomic():
+            stats.comments_removed([instance])
+            instance.delete()
+
     @action(detail=False, methods=["get"])
     def flagged(self, request):
         """
@@ -69,3 +91,88 @@ class CommentViewSet(viewsets.ModelViewSet):
         flagged_comments = self.queryset.filter(flagged=True)
         serializer = self.get_serializer(flagged_comments, many=True)
         return Response(serializer.data)
+
+
+class ArchivedCommentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only ViewSet for comments moved out by ``manage.py archive_comments``.
+
+    Provides:
+    - list: GET /api/archived-comments/
+    - retrieve: GET /api/archived-comments/{id}/
+
+    Can filter by:
+    - post: /api/archived-comments/?post=1
+    - flagged: /api/archived-comments/?flagged=true
+    """
+
+    queryset = ArchivedComment.objects.all()
+    serializer_class = ArchivedCommentSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["post", "flagged"]
+    ordering_fields = ["created_at", "archived_at"]
+    ordering = ["created_at"]
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """
+    Moderation statistics, served from the daily rollups only.
+
+    Provides:
+    - list: GET /api/stats/
+
+    Query parameters:
+    - start, end: date range, YYYY-MM-DD (default: the last 30 days)
+    - post: restrict to one post
+    - limit: number of posts in the per-post breakdown (default 50)
+    """
+
+    COUNTS = {
+        "total": Sum("total"),
+        "flagged": Sum("flagged"),
+        "overridden": Sum("overridden"),
+    }
+
+    def list(self, request):
+        query = StatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rows = DailyCommentStats.objects.filter(
+            date__range=(params["start"], params["end"])
+        )
+        if "post" in params:
+            rows = rows.filter(post_id=params["post"])
+
+        daily = rows.values("date").annotate(**self.COUNTS).order_by("date")
+        posts = (
+            rows.values("post", "post__title")
+            .annotate(**self.COUNTS)
+            .order_by("-total", "post_id")[: params["limit"]]
+        )
+        return Response(
+            {
+                "start": params["start"],
+                "end": params["end"],
+                "totals": self._with_rates(rows.aggregate(**self.COUNTS)),
+                "daily": [self._with_rates(row) for row in daily],
+                "posts": [
+                    self._with_rates(
+                        {
+                            "post": row.pop("post"),
+                            "title": row.pop("post__title"),
+                            **row,
+                        }
+                    )
+                    for row in posts
+                ],
+            }
+        )
+
+    @staticmethod
+    def _with_rates(row):
+        for field in ("total", "flagged", "overridden"):
+            row[field] = row[field] or 0
+        row["flag_rate"] = row["flagged"] / row["total"] if row["total"] else 0.0
+        row["override_rate"] = row["overridden"] / row["total"] if row["total"] else 0.0
+        return row
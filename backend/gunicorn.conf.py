@@ -0,0 +1,59 @@
+"""
+Gunicorn configuration, picked up automatically when gunicorn is started
+from this directory: ``gunicorn smart_comments.wsgi:application``.
+
+The app is imported once in the master (``preload_app``), which also
+builds and warms up the classifier before forking. Workers then start
+without repeating that work and share the loaded models and indexes
+copy-on-write instead of each holding its own copy.
+"""
+
+import gc
+import os
+
+import decouple
+
+# Every top-level name in this file is read as a gunicorn setting, and
+# "config" is one of them, so decouple is not imported by name.
+bind = decouple.config("GUNICORN_BIND", default="0.0.0.0:8000")
+workers = decouple.config(
+    "GUNICORN_WORKERS", default=(os.cpu_count() or 1) * 2 + 1, cast=int
+)
+preload_app = decouple.config("GUNICORN_PRELOAD", default=True, cast=bool)
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker forks.
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    from blog.classification import warm_up
+
+    warm_up()
+    # Database connections must not be shared across forks.
+    connections.close_all()
+    # Move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers don't write to (and un-share) those pages.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Without preloading, each worker loads its own classifier. Start that
+    # now, with the near-duplicate index filling in a background thread,
+    # rather than on the first request.
+    if worker.cfg.preload_app:
+        return
+    from blog.classification import get_classifier
+
+    classifier = get_classifier()
+    if classifier.near_duplicates is not None:
+        classifier.near_duplicates.refresh()
+
+
+def child_exit(server, worker):
+    # Drop the live-only samples of the exited worker from /metrics.
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
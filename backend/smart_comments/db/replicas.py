@@ -0,0 +1,119 @@
+"""
+Read-replica routing.
+
+Reads of blog models are spread over the ``replica_*`` aliases in
+``DATABASES`` while writes always go to ``default``. A client that has just
+written (e.g. POSTed a comment) is pinned to the primary for
+``DB_PRIMARY_STICKY_SECONDS`` so it reads its own writes despite
+replication lag. Queries per alias are exported as the ``db_queries``
+metric (see smart_comments/metrics.py).
+"""
+
+import contextlib
+import contextvars
+import itertools
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from smart_comments.http import client_ip
+from smart_comments.metrics import queries_in_flight
+
+REPLICA_PREFIX = "replica_"
+ROUTED_APPS = {"blog"}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_use_primary = contextvars.ContextVar("use_primary", default=False)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Route every read inside the block to the primary database."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send blog reads to replicas and everything else to the primary.
+
+    Selection is ``round_robin`` or ``least_loaded``, set with
+    ``DB_REPLICA_SELECTION``. ``least_loaded`` picks the replica with the
+    fewest queries in flight from this process's other threads, taking
+    ties in round-robin order. Only threaded workers (gunicorn ``gthread``)
+    run queries concurrently; under sync workers nothing else is ever in
+    flight, so it behaves exactly like ``round_robin``.
+    """
+
+    def __init__(self, replicas=None, selection=None):
+        if replicas is None:
+            replicas = [
+                alias
+                for alias in settings.DATABASES
+                if alias.startswith(REPLICA_PREFIX)
+            ]
+        self.replicas = list(replicas)
+        self.selection = selection or getattr(
+            settings, "DB_REPLICA_SELECTION", "round_robin"
+        )
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+
+    def _pick_replica(self):
+        with self._lock:
+            replica = next(self._cycle)
+        if self.selection == "least_loaded":
+            start = self.replicas.index(replica)
+            order = self.replicas[start:] + self.replicas[:start]
+            return min(order, key=queries_in_flight)
+        return replica
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS or not self.replicas:
+            return None
+        # Reads inside a write transaction must see that transaction.
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self._pick_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any of them can relate.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return not db.startswith(REPLICA_PREFIX)
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Pin clients to the primary for a short window after they write.
+
+    Writing requests always use the primary. A successful write marks the
+    client (by IP) in the cache, and its reads go to the primary until the
+    mark expires. The cache must be shared between workers for the window
+    to hold across processes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.window = getattr(settings, "DB_PRIMARY_STICKY_SECONDS", 5)
+
+    def __call__(self, request):
+        key = f"db:primary:{client_ip(request)}"
+        writing = request.method not in SAFE_METHODS
+        token = _use_primary.set(writing or cache.get(key, False))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        if writing and response.status_code < 400 and self.window:
+            cache.set(key, True, self.window)
+        return response
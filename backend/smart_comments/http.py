@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+def client_ip(request):
+    """
+    Best-effort client address for per-client bookkeeping.
+
+    X-Forwarded-For is only trusted for the number of reverse proxies
+    configured in NUM_PROXIES, counted from the right, so clients cannot
+    spoof their address by sending the header themselves.
+    """
+    num_proxies = getattr(settings, "NUM_PROXIES", 0)
+    if num_proxies:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        addresses = [addr.strip() for addr in forwarded.split(",") if addr.strip()]
+        if addresses:
+            return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR", "")
@@ -0,0 +1,181 @@
+"""
+Prometheus metrics for requests, database queries and classification.
+
+Served at ``/metrics`` in the Prometheus text format. Under gunicorn, set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty directory: every worker then
+writes its samples to its own memory-mapped files (no cross-process
+locking on the hot path) and a scrape of any worker aggregates all of
+them. ``gunicorn.conf.py`` cleans up after exited workers.
+"""
+
+import contextvars
+import os
+import time
+from collections import deque
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by view and action",
+    ["view", "action", "status"],
+)
+DB_QUERIES_TOTAL = Counter(
+    "db_queries", "Database queries executed, by database alias", ["alias"]
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "Database queries executed per request",
+    ["view", "action"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, float("inf")),
+)
+DB_QUERY_TIME = Histogram(
+    "db_query_seconds_per_request",
+    "Time spent in database queries per request",
+    ["view", "action"],
+)
+CLASSIFY_LATENCY = Histogram(
+    "classify_comment_duration_seconds",
+    "classify_comment latency",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 1),
+)
+CLASSIFY_TOTAL = Counter("classify_comment", "Comments classified", ["classification"])
+CLASSIFY_REASONS = Counter(
+    "classify_comment_reason",
+    "Classification reasons that fired (for fast verdicts, the deciding one)",
+    ["reason"],
+)
+CLASSIFY_RULE_SECONDS = Counter(
+    "classify_rule_seconds",
+    "Time spent in each classification rule (sampled calls only)",
+    ["rule"],
+)
+CLASSIFY_RULE_EVALUATIONS = Counter(
+    "classify_rule_evaluations",
+    "Sampled evaluations of each classification rule",
+    ["rule"],
+)
+CLASSIFY_RULE_HITS = Counter(
+    "classify_rule_hits",
+    "Sampled evaluations in which each classification rule fired",
+    ["rule"],
+)
+
+# Per-request database totals: [query count, seconds].
+_db_stats = contextvars.ContextVar("db_stats", default=None)
+# One entry per query executing right now, per alias. Appending to and
+# popping from a deque is atomic, so threads need no lock to share these.
+_in_flight = {}
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    _in_flight.setdefault(connection.alias, deque())
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def queries_in_flight(alias):
+    """Queries this process is executing on ``alias`` right now."""
+    return len(_in_flight.get(alias, ()))
+
+
+def _time_query(execute, sql, params, many, context):
+    alias = context["connection"].alias
+    DB_QUERIES_TOTAL.labels(alias).inc()
+    in_flight = _in_flight[alias]
+    in_flight.append(None)
+    stats = _db_stats.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        in_flight.pop()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+
+
+def reason_label(reason):
+    """Bounded label for a reason, dropping per-comment details."""
+    return reason.split(":")[0].split(" (")[0]
+
+
+def _observe(flagged, seconds, reasons):
+    CLASSIFY_LATENCY.observe(seconds)
+    CLASSIFY_TOTAL.labels("needs_review" if flagged else "safe").inc()
+    for reason in reasons:
+        CLASSIFY_REASONS.labels(reason_label(reason)).inc()
+
+
+def observe_verdict(reason, seconds):
+    """Record a fast verdict, given the reason that decided it (None if safe)."""
+    _observe(reason is not None, seconds, [reason] if reason is not None else [])
+
+
+def observe_classification(result, seconds):
+    _observe(result["flagged"], seconds, result["reasons"])
+
+
+def observe_rule(rule, seconds, hit):
+    CLASSIFY_RULE_SECONDS.labels(rule).inc(seconds)
+    CLASSIFY_RULE_EVALUATIONS.labels(rule).inc()
+    if hit:
+        CLASSIFY_RULE_HITS.labels(rule).inc()
+
+
+class MetricsMiddleware:
+    """Record latency and database usage of every request by view and action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = [0, 0.0]
+        token = _db_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _db_stats.reset(token)
+        elapsed = time.perf_counter() - start
+
+        view, action = self._labels(request)
+        REQUEST_LATENCY.labels(view, action, response.status_code).observe(elapsed)
+        DB_QUERIES.labels(view, action).observe(stats[0])
+        DB_QUERY_TIME.labels(view, action).observe(stats[1])
+        return response
+
+    @staticmethod
+    def _labels(request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "unmatched", request.method.lower()
+        func = match.func
+        # DRF viewsets expose their class and the method -> action mapping.
+        cls = getattr(func, "cls", None)
+        actions = getattr(func, "actions", None) or {}
+        view = cls.__name__ if cls else getattr(func, "__name__", match.view_name)
+        action = actions.get(request.method.lower(), request.method.lower())
+        return view, action
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, aggregated across worker processes."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -18,7 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from .metrics import metrics
+from .views import health
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("blog.urls")),
+    path("health/", health, name="health"),
+    path("metrics", metrics, name="metrics"),
 ]
@@ -0,0 +1,6 @@
+from django.http import JsonResponse
+
+
+def health(request):
+    """Liveness check for load balancers and container orchestration."""
+    return JsonResponse({"status": "ok"})